@@ -1,17 +1,96 @@
-import json
+import orjson
 import os
 import csv
 import sys
+import re
+import threading
+from datetime import date, datetime
+from itertools import chain, islice
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from neo4j import GraphDatabase
 
 # Load environment variables
 load_dotenv()
 
+# Number of rows sent to Neo4j per UNWIND transaction
+BATCH_SIZE = 1000
+
+# Number of rows per statement when the server splits them into concurrent transactions
+CONCURRENT_BATCH_SIZE = 10 * BATCH_SIZE
+
+# Worker threads loading node labels concurrently
+NODE_WORKERS = 8
+
+# Worker threads for client-side relationship loading on older Neo4j versions
+RELATIONSHIP_WORKERS = 4
+
+# First Neo4j version supporting CALL { ... } IN CONCURRENT TRANSACTIONS
+CONCURRENT_TRANSACTIONS_VERSION = (5, 21)
+
+# SQL column types (as recorded in the ontology) stored as native Neo4j values
+INTEGER_TYPES = {'smallint', 'integer', 'bigint', 'int', 'serial', 'bigserial'}
+FLOAT_TYPES = {'numeric', 'decimal', 'real', 'double precision', 'float', 'money'}
+
+def chunked(iterable, size):
+    """Yield successive lists of up to `size` items from an iterable"""
+    it = iter(iterable)
+    return iter(lambda: list(islice(it, size)), [])
+
+def parse_bool(value):
+    """Parse a boolean exported as text"""
+    return value.lower() in ('true', 't', '1', 'yes')
+
+def get_type_converter(sql_type):
+    """Return a function converting a CSV string to the native value for a SQL type, or None"""
+    sql_type = (sql_type or '').lower()
+    if sql_type in INTEGER_TYPES:
+        return int
+    if sql_type in FLOAT_TYPES:
+        return float
+    if sql_type == 'boolean':
+        return parse_bool
+    if sql_type == 'date':
+        return date.fromisoformat
+    if sql_type.startswith('timestamp'):
+        return datetime.fromisoformat
+    return None
+
+def batches_by_source(pairs, size):
+    """Yield batches of about `size` source-ordered pairs, never splitting one source node's rows"""
+    batch = []
+    for pair in pairs:
+        # Only cut where the source changes, so concurrent batches don't lock the same node
+        if len(batch) >= size and pair['f'] != batch[-1]['f']:
+            yield batch
+            batch = []
+        batch.append(pair)
+    if batch:
+        yield batch
+
+def get_driver_config(uri):
+    """Driver settings for bulk loads: a larger pool and fetch size, and no TLS on localhost"""
+    config = {
+        "max_connection_pool_size": 50,
+        "fetch_size": 10000,
+        "connection_acquisition_timeout": 60,
+        "connection_timeout": 30,
+    }
+    # Encryption can only be configured for plain bolt:// and neo4j:// URIs
+    parsed = urlparse(uri)
+    if parsed.scheme in ("bolt", "neo4j") and parsed.hostname in ("localhost", "127.0.0.1"):
+        config["encrypted"] = False
+    return config
+
 class KnowledgeGraphBuilder:
     def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.driver = GraphDatabase.driver(uri, auth=(user, password), **get_driver_config(uri))
         self.ontology = None
+        self.node_keys = {}  # node class -> key property
+        # Query strings are built once so Neo4j's plan cache sees identical text
+        self.node_queries = {}
+        self.relationship_queries = {}
     
     def close(self):
         """Close Neo4j connection"""
@@ -20,18 +99,56 @@ class KnowledgeGraphBuilder:
     def load_ontology(self, ontology_file="ontology_output.json"):
         """Load the ontology JSON file"""
         try:
-            with open(ontology_file, 'r') as f:
-                self.ontology = json.load(f)
+            with open(ontology_file, 'rb') as f:
+                self.ontology = orjson.loads(f.read())
+            self.node_keys = self.find_key_properties()
             print(f"✓ Loaded ontology: {len(self.ontology['nodes'])} nodes, {len(self.ontology['edges'])} edges")
             return True
         except Exception as e:
             print(f"✗ Error loading ontology: {e}")
             return False
     
-    def clear_database(self):
+    def find_key_properties(self):
+        """Map each node class to its key property (usually nodeId)"""
+        node_keys = {}
+        for node in self.ontology['nodes']:
+            for prop in node['properties']:
+                if prop.get('is_key', False):
+                    node_keys[node['class']] = prop['property']
+                    break
+        return node_keys
+    
+    def get_edge_keys(self, edge):
+        """Return the (from, to) properties used to match a relationship's endpoints"""
+        # Endpoints are matched on each node's key property, or on sku for sku-based relationships
+        if 'sku' in edge['csv_file'].lower():
+            return 'sku', 'sku'
+        return (self.node_keys.get(edge['from_node'], 'nodeId'),
+                self.node_keys.get(edge['to_node'], 'nodeId'))
+    
+    def get_server_version(self):
+        """Return the Neo4j kernel version as a tuple of ints, e.g. (5, 21, 0)"""
+        with self.driver.session() as session:
+            record = session.run(
+                "CALL dbms.components() YIELD name, versions WHERE name = 'Neo4j Kernel' RETURN versions[0] AS version"
+            ).single()
+        if not record:
+            return ()
+        return tuple(int(part) for part in re.findall(r"\d+", record["version"])[:3])
+    
+    def clear_database(self, replace_database=False):
         """Clear all nodes and relationships from the database"""
+        if replace_database:
+            # Enterprise only: recreating the database is near-instant regardless of graph size
+            with self.driver.session(database="system") as session:
+                session.run("CREATE OR REPLACE DATABASE neo4j WAIT").consume()
+            print("✓ Database replaced")
+            return
+        
+        # Delete in batches so large graphs don't exhaust the transaction heap;
+        # CALL ... IN TRANSACTIONS must run in an auto-commit transaction
         with self.driver.session() as session:
-            session.run("MATCH (n) DETACH DELETE n")
+            session.run("MATCH (n) CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS").consume()
             print("✓ Database cleared")
     
     def create_constraints(self):
@@ -40,131 +157,325 @@ class KnowledgeGraphBuilder:
         with self.driver.session() as session:
             for node in self.ontology['nodes']:
                 node_class = node['class']
-                # Find the key property (usually nodeId)
-                key_property = None
-                for prop in node['properties']:
-                    if prop.get('is_key', False):
-                        key_property = prop['property']
-                        break
+                key_property = self.node_keys.get(node_class)
                 
                 if key_property:
                     constraint_name = f"constraint_{node_class}_{key_property}"
                     try:
-                        # Drop existing constraint if it exists
-                        session.run(f"DROP CONSTRAINT {constraint_name} IF EXISTS")
-                        # Create new constraint
-                        query = f"CREATE CONSTRAINT {constraint_name} FOR (n:{node_class}) REQUIRE n.{key_property} IS UNIQUE"
-                        session.run(query)
+                        # Existing constraints are kept so their backing index is not rebuilt
+                        query = f"CREATE CONSTRAINT {constraint_name} IF NOT EXISTS FOR (n:{node_class}) REQUIRE n.{key_property} IS UNIQUE"
+                        session.run(query).consume()
                         print(f"  ✓ Constraint created for {node_class}.{key_property}")
                     except Exception as e:
                         print(f"  ⚠ Constraint for {node_class}.{key_property}: {e}")
     
+    def create_indexes(self):
+        """Create indexes for relationship endpoint lookups, relationship types and relationship properties"""
+        print("\nCreating indexes...")
+        endpoints = set()
+        for edge in self.ontology['edges']:
+            from_key, to_key = self.get_edge_keys(edge)
+            endpoints.add((edge['from_node'], from_key))
+            endpoints.add((edge['to_node'], to_key))
+        
+        with self.driver.session() as session:
+            for label, prop in sorted(endpoints):
+                # Unique constraints already come with an index
+                if self.node_keys.get(label) == prop:
+                    continue
+                try:
+                    session.run(f"CREATE INDEX idx_{label}_{prop} IF NOT EXISTS FOR (n:{label}) ON (n.{prop})").consume()
+                    print(f"  ✓ Index created for {label}.{prop}")
+                except Exception as e:
+                    print(f"  ⚠ Index for {label}.{prop}: {e}")
+            
+            # Relationship type lookups speed up traversals that start from a relationship type
+            try:
+                session.run("CREATE LOOKUP INDEX rel_type_lookup IF NOT EXISTS FOR ()-[r]-() ON EACH type(r)").consume()
+                print("  ✓ Relationship type lookup index created")
+            except Exception as e:
+                print(f"  ⚠ Relationship type lookup index: {e}")
+            
+            # Index any properties the ontology declares on relationships
+            for edge in self.ontology['edges']:
+                relationship = edge['relationship']
+                for prop in edge.get('properties', []):
+                    prop_name = prop['property'] if isinstance(prop, dict) else prop
+                    try:
+                        session.run(
+                            f"CREATE INDEX idx_{relationship}_{prop_name} IF NOT EXISTS FOR ()-[r:{relationship}]-() ON (r.{prop_name})"
+                        ).consume()
+                        print(f"  ✓ Index created for {relationship}.{prop_name}")
+                    except Exception as e:
+                        print(f"  ⚠ Index for {relationship}.{prop_name}: {e}")
+    
+    def get_node_query(self, node_class):
+        """Return the cached UNWIND query that writes a batch of node_class nodes"""
+        if node_class not in self.node_queries:
+            # Upsert nodes on their key property so re-running the loader is idempotent
+            key_property = self.node_keys.get(node_class)
+            if key_property:
+                query = f"""
+                UNWIND $rows AS row
+                MERGE (n:{node_class} {{{key_property}: row.{key_property}}})
+                ON CREATE SET n = row
+                ON MATCH SET n += row
+                """
+            else:
+                query = f"UNWIND $rows AS row CREATE (n:{node_class}) SET n = row"
+            self.node_queries[node_class] = query
+        return self.node_queries[node_class]
+    
+    def get_relationship_query(self, from_node, to_node, relationship, from_key, to_key, concurrent):
+        """Return the cached UNWIND query that writes a batch of relationships"""
+        cache_key = (from_node, to_node, relationship, from_key, to_key, concurrent)
+        if cache_key not in self.relationship_queries:
+            # Match nodes and create relationships in UNWIND batches
+            match_merge = f"""
+                MATCH (a:{from_node} {{{from_key}: p.f}})
+                MATCH (b:{to_node} {{{to_key}: p.t}})
+                MERGE (a)-[r:{relationship}]->(b)
+            """
+            if concurrent:
+                # Let the server split each statement into parallel transactions
+                query = f"""
+                UNWIND $pairs AS p
+                CALL {{
+                    WITH p
+                    {match_merge}
+                }} IN CONCURRENT TRANSACTIONS OF {BATCH_SIZE} ROWS
+                """
+            else:
+                query = f"UNWIND $pairs AS p {match_merge}"
+            self.relationship_queries[cache_key] = query
+        return self.relationship_queries[cache_key]
+    
     def load_nodes(self):
         """Load nodes from CSV files"""
         print("\nLoading nodes from CSV files...")
         
-        for node in self.ontology['nodes']:
-            node_class = node['class']
-            csv_file = node['csv_file']
-            table = node['table']
-            properties = node['properties']
-            
+        row_counts = self.count_csv_rows(node['csv_file'] for node in self.ontology['nodes'])
+        nodes = [node for node in self.ontology['nodes'] if self.has_csv_rows(node['csv_file'], row_counts)]
+        if not nodes:
+            return
+        
+        # Labels are independent, so each one is loaded on its own worker and session
+        with ThreadPoolExecutor(max_workers=min(NODE_WORKERS, len(nodes))) as executor:
+            list(executor.map(lambda node: self.load_node_label(node, row_counts[node['csv_file']]), nodes))
+    
+    def count_csv_rows(self, csv_files):
+        """Count data rows in each CSV file in parallel (None if the file is missing)"""
+        def count_rows(csv_file):
             if not os.path.exists(csv_file):
-                print(f"  ✗ CSV file not found: {csv_file}")
-                continue
-            
-            # Read CSV and create nodes
-            with open(csv_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                rows = list(reader)
+                return None
+            # Counting raw lines is much faster than parsing; subtract the header
+            with open(csv_file, 'rb') as f:
+                return max(0, sum(1 for _ in f) - 1)
+        
+        csv_files = list(dict.fromkeys(csv_files))
+        if not csv_files:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(NODE_WORKERS, len(csv_files))) as executor:
+            return dict(zip(csv_files, executor.map(count_rows, csv_files)))
+    
+    def has_csv_rows(self, csv_file, row_counts):
+        """Report missing or empty CSV files, returning True if there is data to load"""
+        row_count = row_counts.get(csv_file)
+        if row_count is None:
+            print(f"  ✗ CSV file not found: {csv_file}")
+            return False
+        if row_count == 0:
+            print(f"  ⚠ No data in {csv_file}")
+            return False
+        return True
+    
+    def load_node_label(self, node, row_count):
+        """Load the nodes of one ontology class from its CSV file"""
+        node_class = node['class']
+        csv_file = node['csv_file']
+        table = node['table']
+        properties = node['properties']
+        
+        # Build property mapping
+        prop_map = {prop['column']: prop['property'] for prop in properties}
+        # Store values natively using the ontology types; keys stay strings to match edge CSVs
+        converters = {prop['column']: get_type_converter(prop.get('type'))
+                      for prop in properties if not prop.get('is_key', False)}
+        
+        key_property = self.node_keys.get(node_class)
+        query = self.get_node_query(node_class)
+        
+        # Stream the CSV so only one batch of rows is held in memory
+        with open(csv_file, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            # Resolve column positions and type converters once instead of per row
+            col_idx = [(header.index(col), prop_name, converters.get(col))
+                       for col, prop_name in prop_map.items() if col in header]
+            node_rows = (self.build_node_props(row, col_idx) for row in reader)
+            node_rows = (props for props in node_rows
+                         if props and (not key_property or key_property in props))
             
-            if not rows:
+            # Peek at the first batch so empty files are skipped without opening a session
+            batches = chunked(node_rows, BATCH_SIZE)
+            first = next(batches, None)
+            if first is None:
                 print(f"  ⚠ No data in {csv_file}")
-                continue
-            
-            # Build property mapping
-            prop_map = {prop['column']: prop['property'] for prop in properties}
+                return
             
-            # Create Cypher query for batch import
-            with self.driver.session() as session:
-                count = 0
-                for row in rows:
-                    # Build properties dict
-                    props = {}
-                    for col, prop_name in prop_map.items():
-                        if col in row and row[col]:
-                            # Convert empty strings to None
-                            value = row[col] if row[col] != '' else None
-                            if value:
-                                props[prop_name] = value
-                    
-                    # Create node
-                    if props:
-                        query = f"CREATE (n:{node_class} $props)"
-                        session.run(query, props=props)
-                        count += 1
+            # Write nodes in UNWIND batches, one transaction per batch
+            count = self.write_batches(query, chain([first], batches), 'rows')
+        
+        print(f"  ✓ Loaded {count} {node_class} nodes from {csv_file} ({row_count} rows)")
+    
+    def load_csv_value(self, prop):
+        """Return the Cypher expression reading a property's column from a LOAD CSV line"""
+        value = f"line.`{prop['column']}`"
+        if prop.get('is_key', False):
+            return value
+        sql_type = (prop.get('type') or '').lower()
+        if sql_type in INTEGER_TYPES:
+            return f"toInteger({value})"
+        if sql_type in FLOAT_TYPES:
+            return f"toFloat({value})"
+        if sql_type == 'boolean':
+            # COPY ... FORMAT CSV writes booleans as t/f, which toBoolean() doesn't accept
+            return f"CASE {value} WHEN 't' THEN true WHEN 'f' THEN false ELSE toBoolean({value}) END"
+        return value
+    
+    def load_nodes_via_load_csv(self):
+        """Load nodes server-side with LOAD CSV from files staged in Neo4j's import directory"""
+        print("\nLoading nodes with LOAD CSV...")
+        
+        with self.driver.session() as session:
+            for node in self.ontology['nodes']:
+                node_class = node['class']
+                csv_file = os.path.basename(node['csv_file'])
+                prop_map = {prop['column']: prop['property'] for prop in node['properties']}
+                key_property = self.node_keys.get(node_class)
                 
-                print(f"  ✓ Created {count} {node_class} nodes from {csv_file}")
+                set_clause = ", ".join(
+                    f"n.`{prop['property']}` = {self.load_csv_value(prop)}" for prop in node['properties']
+                )
+                key_column = next((col for col, prop_name in prop_map.items() if prop_name == key_property), None)
+                if key_column:
+                    write = f"""
+                    WITH line WHERE line.`{key_column}` IS NOT NULL
+                    MERGE (n:{node_class} {{{key_property}: line.`{key_column}`}})
+                    SET {set_clause}
+                    """
+                else:
+                    write = f"CREATE (n:{node_class}) SET {set_clause}"
+                
+                query = f"""
+                LOAD CSV WITH HEADERS FROM 'file:///{csv_file}' AS line
+                CALL {{
+                    WITH line
+                    {write}
+                }} IN TRANSACTIONS OF 10000 ROWS
+                """
+                try:
+                    # CALL ... IN TRANSACTIONS must run in an auto-commit transaction
+                    summary = session.run(query).consume()
+                    print(f"  ✓ Loaded {summary.counters.nodes_created} new {node_class} nodes from {csv_file}")
+                except Exception as e:
+                    print(f"  ✗ LOAD CSV failed for {csv_file}: {e}")
+    
+    def build_node_props(self, row, col_idx):
+        """Map a CSV row to node properties, dropping empty values"""
+        props = {}
+        for i, prop_name, convert in col_idx:
+            # csv.reader yields strings, so empty cells are the only missing values
+            if i < len(row) and (value := row[i]) != '':
+                if convert:
+                    try:
+                        value = convert(value)
+                    except ValueError:
+                        pass  # Keep the raw string if it doesn't parse
+                props[prop_name] = value
+        return props
     
     def load_relationships(self):
         """Load relationships from CSV files"""
         print("\nLoading relationships from CSV files...")
         
+        concurrent = self.get_server_version() >= CONCURRENT_TRANSACTIONS_VERSION
+        if concurrent:
+            print("  Using CALL { ... } IN CONCURRENT TRANSACTIONS")
+        
+        row_counts = self.count_csv_rows(edge['csv_file'] for edge in self.ontology['edges'])
+        
         for edge in self.ontology['edges']:
             relationship = edge['relationship']
             from_node = edge['from_node']
             to_node = edge['to_node']
             csv_file = edge['csv_file']
             
-            if not os.path.exists(csv_file):
-                print(f"  ✗ CSV file not found: {csv_file}")
+            if not self.has_csv_rows(csv_file, row_counts):
                 continue
             
-            # Read CSV
-            with open(csv_file, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                header = next(reader)  # Skip header
-                rows = list(reader)
+            from_key, to_key = self.get_edge_keys(edge)
             
-            if not rows:
-                print(f"  ⚠ No data in {csv_file}")
-                continue
+            query = self.get_relationship_query(from_node, to_node, relationship, from_key, to_key, concurrent)
             
-            # Create relationships
-            with self.driver.session() as session:
-                count = 0
-                for row in rows:
-                    if len(row) >= 2 and row[0] and row[1]:
-                        from_value = row[0]
-                        to_value = row[1]
-                        
-                        # Match nodes and create relationship
-                        query = f"""
-                        MATCH (a:{from_node})
-                        MATCH (b:{to_node})
-                        WHERE a.nodeId = $from_value AND b.nodeId = $to_value
-                        MERGE (a)-[r:{relationship}]->(b)
-                        """
-                        
-                        try:
-                            session.run(query, from_value=from_value, to_value=to_value)
-                            count += 1
-                        except Exception as e:
-                            # Try with sku if nodeId doesn't match
-                            if 'sku' in csv_file.lower():
-                                query = f"""
-                                MATCH (a:{from_node})
-                                MATCH (b:{to_node})
-                                WHERE a.sku = $from_value AND b.sku = $to_value
-                                MERGE (a)-[r:{relationship}]->(b)
-                                """
-                                try:
-                                    session.run(query, from_value=from_value, to_value=to_value)
-                                    count += 1
-                                except:
-                                    pass
+            with open(csv_file, 'r', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                header = next(reader, None)  # Skip header
+                pairs = ({"f": row[0], "t": row[1]} for row in reader
+                         if len(row) >= 2 and row[0] and row[1])
                 
-                print(f"  ✓ Created {count} {relationship} relationships from {csv_file}")
+                if concurrent:
+                    # Stream the CSV so only one batch of pairs is held in memory
+                    batches = chunked(pairs, CONCURRENT_BATCH_SIZE)
+                    first = next(batches, None)
+                    if first is None:
+                        print(f"  ⚠ No data in {csv_file}")
+                        continue
+                    
+                    # CALL ... IN TRANSACTIONS must run in an auto-commit transaction
+                    count = 0
+                    with self.driver.session() as session:
+                        for batch in chain([first], batches):
+                            session.run(query, pairs=batch).consume()
+                            count += len(batch)
+                else:
+                    # The export orders rows by source node, so batches cut at source boundaries
+                    # give each worker its own sources and avoid lock contention
+                    batches = batches_by_source(pairs, BATCH_SIZE)
+                    first = next(batches, None)
+                    if first is None:
+                        print(f"  ⚠ No data in {csv_file}")
+                        continue
+                    
+                    # Stream the CSV, keeping at most two batches per worker in flight
+                    in_flight = threading.BoundedSemaphore(2 * RELATIONSHIP_WORKERS)
+                    futures = []
+                    with ThreadPoolExecutor(max_workers=RELATIONSHIP_WORKERS) as executor:
+                        for batch in chain([first], batches):
+                            in_flight.acquire()
+                            future = executor.submit(self.write_batches, query, [batch], 'pairs')
+                            future.add_done_callback(lambda _: in_flight.release())
+                            futures.append(future)
+                    count = sum(future.result() for future in futures)
+            
+            print(f"  ✓ Created {count} {relationship} relationships from {csv_file} ({row_counts[csv_file]} rows)")
+    
+    def write_batches(self, query, batches, param):
+        """Write batches of rows with UNWIND on a dedicated session, returning the row count"""
+        count = 0
+        with self.driver.session() as session:
+            for batch in batches:
+                # One retried transaction per batch; consuming the result lets it commit promptly
+                session.execute_write(lambda tx, rows=batch: tx.run(query, {param: rows}).consume())
+                count += len(batch)
+        return count
+    
+    def fetch_all(self, session, query):
+        """Run a read query and drain it so the server releases the cursor before the next query"""
+        result = session.run(query)
+        records = result.data()
+        result.consume()
+        return records
     
     def run_test_queries(self):
         """Run various test queries to verify the knowledge graph"""
@@ -180,8 +491,7 @@ class KnowledgeGraphBuilder:
             RETURN labels(n)[0] as NodeType, count(n) as Count
             ORDER BY Count DESC
             """
-            result = session.run(query)
-            for record in result:
+            for record in self.fetch_all(session, query):
                 print(f"   {record['NodeType']}: {record['Count']}")
             
             # Test 2: Count all relationships
@@ -191,8 +501,7 @@ class KnowledgeGraphBuilder:
             RETURN type(r) as RelationType, count(r) as Count
             ORDER BY Count DESC
             """
-            result = session.run(query)
-            for record in result:
+            for record in self.fetch_all(session, query):
                 print(f"   {record['RelationType']}: {record['Count']}")
             
             # Test 3: Find customers and their orders
@@ -203,8 +512,7 @@ class KnowledgeGraphBuilder:
                    o.nodeId as OrderId, o.status as Status, o.totalAmount as Amount
             LIMIT 5
             """
-            result = session.run(query)
-            for record in result:
+            for record in self.fetch_all(session, query):
                 print(f"   {record['Customer']} ({record['Email']}): Order #{record['OrderId']} - {record['Status']} - ${record['Amount']}")
             
             # Test 4: Products in orders
@@ -215,8 +523,7 @@ class KnowledgeGraphBuilder:
                    p.name as Product, oi.quantity as Quantity, oi.unitPrice as Price
             LIMIT 5
             """
-            result = session.run(query)
-            for record in result:
+            for record in self.fetch_all(session, query):
                 print(f"   {record['Customer']}'s Order #{record['OrderId']}: {record['Quantity']}x {record['Product']} @ ${record['Price']}")
             
             # Test 5: Products by category
@@ -226,8 +533,7 @@ class KnowledgeGraphBuilder:
             RETURN c.name as Category, collect(p.name) as Products, count(p) as Count
             ORDER BY Count DESC
             """
-            result = session.run(query)
-            for record in result:
+            for record in self.fetch_all(session, query):
                 products = record['Products'][:3]  # Show first 3
                 print(f"   {record['Category']} ({record['Count']}): {', '.join(products)}{'...' if record['Count'] > 3 else ''}")
             
@@ -238,9 +544,8 @@ class KnowledgeGraphBuilder:
             RETURN p.sku as ChildSKU, parent.sku as ParentSKU
             LIMIT 5
             """
-            result = session.run(query)
             count = 0
-            for record in result:
+            for record in self.fetch_all(session, query):
                 print(f"   {record['ChildSKU']} → {record['ParentSKU']}")
                 count += 1
             if count == 0:
@@ -256,8 +561,7 @@ class KnowledgeGraphBuilder:
             ORDER BY TotalSpent DESC
             LIMIT 5
             """
-            result = session.run(query)
-            for record in result:
+            for record in self.fetch_all(session, query):
                 print(f"   {record['Customer']}: {record['OrderCount']} orders, ${record['TotalSpent']:.2f} total")
             
             # Test 8: Graph statistics
@@ -273,22 +577,14 @@ class KnowledgeGraphBuilder:
             print(f"   Total Nodes: {record['NodeCount']}")
             print(f"   Total Relationships: {record['RelationshipCount']}")
 
-def main():
-    print("="*70)
-    print("NEO4J KNOWLEDGE GRAPH BUILDER")
-    print("="*70)
-    
-    # Load Neo4j credentials
-    uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-    user = os.getenv("NEO4J_USER", "neo4j")
-    password = os.getenv("NEO4J_PASSWORD", "password")
-    
+def run(uri, user, password, rebuild=False, replace_database=False, load_csv=False):
+    """Build the knowledge graph from the ontology, raising if any step fails"""
     print(f"\nConnecting to Neo4j at {uri}...")
     
+    # Create builder instance
+    builder = KnowledgeGraphBuilder(uri, user, password)
+    
     try:
-        # Create builder instance
-        builder = KnowledgeGraphBuilder(uri, user, password)
-        
         # Test connection
         with builder.driver.session() as session:
             result = session.run("RETURN 1 as test")
@@ -297,37 +593,64 @@ def main():
         
         # Load ontology
         if not builder.load_ontology():
-            return
-        
-        # Ask to clear database (skip if --auto flag is provided)
-        if '--auto' not in sys.argv:
-            print("\n⚠  This will clear the existing database and rebuild it.")
-            response = input("Continue? (yes/no): ").strip().lower()
-            if response not in ['yes', 'y']:
-                print("Aborted.")
-                return
-        else:
-            print("\n⚠  Auto mode: Clearing and rebuilding database...")
+            raise RuntimeError("Could not load ontology")
         
         # Build knowledge graph
         print("\nBuilding knowledge graph...")
-        builder.clear_database()
+        if rebuild:
+            builder.clear_database(replace_database=replace_database)
         builder.create_constraints()
-        builder.load_nodes()
+        builder.create_indexes()
+        if load_csv:
+            builder.load_nodes_via_load_csv()
+        else:
+            builder.load_nodes()
         builder.load_relationships()
         
         # Run test queries
         builder.run_test_queries()
-        
-        print("\n" + "="*70)
-        print("✓ KNOWLEDGE GRAPH CREATED SUCCESSFULLY!")
-        print("="*70)
-        print("\nYou can now query your graph using Neo4j Browser at:")
-        print(f"  {uri.replace('bolt://', 'http://').replace(':7687', ':7474')}")
-        
+    finally:
         # Close connection
         builder.close()
-        
+    
+    print("\n" + "="*70)
+    print("✓ KNOWLEDGE GRAPH CREATED SUCCESSFULLY!")
+    print("="*70)
+    print("\nYou can now query your graph using Neo4j Browser at:")
+    print(f"  {uri.replace('bolt://', 'http://').replace(':7687', ':7474')}")
+
+def main():
+    print("="*70)
+    print("NEO4J KNOWLEDGE GRAPH BUILDER")
+    print("="*70)
+    
+    # Load Neo4j credentials
+    uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
+    user = os.getenv("NEO4J_USER", "neo4j")
+    password = os.getenv("NEO4J_PASSWORD", "password")
+    
+    # Only clear the database when a full rebuild is requested; otherwise nodes are upserted
+    rebuild = '--rebuild' in sys.argv
+    if rebuild:
+        # Ask to clear database (skip if --auto flag is provided)
+        if '--auto' not in sys.argv:
+            print("\n⚠  This will clear the existing database and rebuild it.")
+            response = input("Continue? (yes/no): ").strip().lower()
+            if response not in ['yes', 'y']:
+                print("Aborted.")
+                return
+        else:
+            print("\n⚠  Auto mode: Clearing and rebuilding database...")
+    
+    try:
+        run(
+            uri, user, password,
+            rebuild=rebuild,
+            # --replace-database drops and recreates the database (Neo4j Enterprise)
+            replace_database='--replace-database' in sys.argv,
+            # --load-csv reads node CSVs already staged in the Neo4j import directory
+            load_csv='--load-csv' in sys.argv
+        )
     except Exception as e:
         print(f"\n✗ Error: {e}")
         print("\nMake sure Neo4j is running and credentials are correct in .env file")
@@ -335,4 +658,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
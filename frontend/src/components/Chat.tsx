@@ -18,6 +18,7 @@ const Chat: React.FC = () => {
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const threadIdRef = useRef<string | undefined>(undefined);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -43,7 +44,9 @@ const Chat: React.FC = () => {
       const res = await axios.post(`${API_BASE_URL}/chat`, {
         query: input,
         stream: false,
+        thread_id: threadIdRef.current,
       });
+      threadIdRef.current = res.data.thread_id;
 
       const assistantMessage: Message = {
         role: 'assistant',
@@ -4,24 +4,38 @@ Combines Neo4j, FAISS vector search, and LangGraph agent
 """
 
 import os
-import sys
-import subprocess
+import asyncio
 import json
+import uuid
+import time
+import re
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from functools import partial
 from typing import Optional, List, Dict, Any, AsyncGenerator
 from dotenv import load_dotenv
+import orjson
+import faiss
+import torch
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 
-from neo4j import GraphDatabase
+from neo4j import AsyncGraphDatabase, AsyncResult
+from neo4j.exceptions import ClientError
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.tools import Tool
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
 from langgraph.prebuilt import create_react_agent
 from langgraph.checkpoint.memory import MemorySaver
 
 from vector_indexer import VectorIndexer
+import schema_extractor
+import schema_to_ontology
+import create_knowledge_graph
 
 load_dotenv()
 
@@ -40,10 +54,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global state
-graph_built = True  # Set to True since graph already exists
-vector_indexer = None
-neo4j_driver = None
+# Shared state (Neo4j driver, vector indexer, agent, graph_built) lives on app.state
+# and is created once in startup(), so concurrent requests never race to build it
+
+# Cached graph_stats_tool output, refreshed after GRAPH_STATS_TTL seconds
+GRAPH_STATS_TTL = 60
+graph_stats_cache = {"output": None, "expires_at": 0.0}
+
+# Graph labels and per-label property keys, loaded lazily and reset after each build
+graph_schema = {"labels": None, "properties": {}}
+
+# Tool Cypher keyed by (tool, label, ...); identical text lets Neo4j reuse cached plans
+query_templates = {}
+
+# Size caps for tool output sent back to the LLM
+MAX_TOOL_OUTPUT = 8192
+MAX_NODE_RELATIONSHIPS = 50
+
+# Vector search bounds: at most MAX_VECTOR_K hits, dropping those below MIN_SIMILARITY
+MAX_VECTOR_K = 10
+MIN_SIMILARITY = 0.3
+
+# Vector search results per (normalized query, k), least recently used evicted first;
+# cleared when the index is rebuilt
+VECTOR_CACHE_SIZE = 1024
+vector_search_cache = OrderedDict()
+
+# Concurrent searches are batched: up to SEARCH_BATCH_SIZE queries, waiting at most SEARCH_BATCH_WAIT seconds
+SEARCH_BATCH_SIZE = 32
+SEARCH_BATCH_WAIT = 0.005
+
+# Embedding and FAISS search run here rather than in FastAPI's shared threadpool;
+# each worker runs torch single-threaded so concurrent searches don't oversubscribe cores
+EMBED_WORKERS = os.cpu_count()
+EMBED_POOL = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+
+# Agent runs allowed at once; beyond this /chat answers 503 instead of queueing on Gemini rate limits
+MAX_CONCURRENT_CHATS = int(os.getenv("MAX_CONCURRENT_CHATS", "8"))
+CHAT_SEM = asyncio.Semaphore(MAX_CONCURRENT_CHATS)
+
+# Matches an explicit row limit such as "LIMIT 25"
+LIMIT_PATTERN = re.compile(r"\bLIMIT\s+\d+\b", re.IGNORECASE)
+
+# System message to guide agent; the fixed id makes later turns of a thread replace it
+# in the conversation memory instead of appending another copy
+SYSTEM_PROMPT = """You are a knowledge graph AI assistant. You have access to tools for:
+- vector_search: Semantic search for finding similar entities
+- cypher_query: Graph traversals and pattern matching
+- get_node_details: Detailed node information
+- filter_nodes: Precise filtering by properties
+- graph_stats: Graph statistics
+
+Choose tools intelligently based on the query:
+- Use vector_search for semantic/fuzzy queries
+- Use cypher_query for relationships and paths
+- Use filter_nodes for exact matches
+- Combine tools when needed
+
+Always explain your reasoning and cite sources."""
+SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT, id="system-prompt")
+
+# Conversation threads whose checkpoints are kept, least recently used deleted first
+MAX_THREADS = int(os.getenv("MAX_THREADS", "256"))
+agent_threads = OrderedDict()
+
+# Per-run agent settings; the thread_id is added per request
+AGENT_CONFIG = {
+    "recursion_limit": 50  # Increase recursion limit
+}
 
 # Request/Response models
 class BuildGraphRequest(BaseModel):
@@ -53,181 +131,386 @@ class BuildGraphRequest(BaseModel):
 class ChatRequest(BaseModel):
     query: str
     stream: bool = True
+    thread_id: Optional[str] = None  # Conversation to continue; a new one is started if omitted
 
 class ChatResponse(BaseModel):
     response: str
     reasoning: List[str]
     tools_used: List[str]
     sources: List[Dict[str, Any]]
+    thread_id: str  # Send back as ChatRequest.thread_id to continue the conversation
 
 # Initialize connections
-def get_neo4j_driver():
-    global neo4j_driver
-    if not neo4j_driver:
-        uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-        user = os.getenv("NEO4J_USER", "neo4j")
-        password = os.getenv("NEO4J_PASSWORD", "password")
-        neo4j_driver = GraphDatabase.driver(uri, auth=(user, password))
-    return neo4j_driver
-
-def get_vector_indexer():
-    global vector_indexer
-    if not vector_indexer:
-        vector_indexer = VectorIndexer()
+def create_neo4j_driver():
+    """Create the async Neo4j driver shared by all requests"""
+    uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
+    user = os.getenv("NEO4J_USER", "neo4j")
+    password = os.getenv("NEO4J_PASSWORD", "password")
+    return AsyncGraphDatabase.driver(
+        uri,
+        auth=(user, password),
+        max_connection_pool_size=50,
+        connection_acquisition_timeout=30
+    )
+
+def create_vector_indexer():
+    """Create the vector indexer and load the saved index if there is one"""
+    indexer = VectorIndexer()
+    try:
+        indexer.load_index()
+    except Exception as e:
+        # No index yet (e.g. before the first /build-graph); searches will report it
+        print(f"⚠ Vector index not loaded: {e}")
+    return indexer
+
+async def get_graph_schema():
+    """Node labels and their property keys, which the tools may interpolate into Cypher"""
+    if graph_schema["labels"] is None:
+        driver = app.state.driver
+        records, _, _ = await driver.execute_query("CALL db.labels() YIELD label RETURN label")
+        labels = {record["label"] for record in records}
+        
+        records, _, _ = await driver.execute_query(
+            "CALL db.schema.nodeTypeProperties() YIELD nodeLabels, propertyName RETURN nodeLabels, propertyName"
+        )
+        properties = {label: set() for label in labels}
+        for record in records:
+            if record["propertyName"] is None:
+                continue
+            for label in record["nodeLabels"]:
+                properties.setdefault(label, set()).add(record["propertyName"])
+        
+        graph_schema["properties"] = properties
+        graph_schema["labels"] = labels
+    return graph_schema
+
+def error_message(e: BaseException) -> str:
+    """Describe an error, unwrapping TaskGroup failures to the underlying query error"""
+    while isinstance(e, BaseExceptionGroup):
+        e = e.exceptions[0]
+    return str(e)
+
+def dump_tool_json(data) -> str:
+    """Serialize tool output as compact JSON, truncated to keep the LLM prompt small"""
+    output = orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    if len(output) > MAX_TOOL_OUTPUT:
+        output = output[:MAX_TOOL_OUTPUT] + "...(truncated)"
+    return output
+
+async def stream_records_to_json(result: AsyncResult, key: Optional[str] = None,
+                                 byte_budget: int = MAX_TOOL_OUTPUT,
+                                 max_records: Optional[int] = None) -> str:
+    """Serialize records as they stream in, stopping once byte_budget or max_records is reached"""
+    chunks = []
+    size = 0
+    truncated = False
+    async for record in result:
+        if size >= byte_budget or len(chunks) == max_records:
+            truncated = True
+            break
+        # data() turns Nodes and Relationships into property maps, which orjson can serialize
+        chunk = orjson.dumps(record.data(key)[key] if key else record.data(), default=str)
+        chunks.append(chunk)
+        size += len(chunk) + 1
+    
+    # Unread rows are discarded when the transaction closes; a single oversized row is cut too
+    output = b"[" + b",".join(chunks) + b"]"
+    if len(output) > byte_budget:
+        output = output[:byte_budget]
+        truncated = True
+    output = output.decode(errors="ignore")
+    if truncated:
+        output += "...(truncated)"
+    return output
+
+def track_thread(thread_id: str):
+    """Mark a conversation as recently used, deleting checkpoints of the oldest beyond MAX_THREADS"""
+    agent_threads[thread_id] = None
+    agent_threads.move_to_end(thread_id)
+    while len(agent_threads) > MAX_THREADS:
+        oldest, _ = agent_threads.popitem(last=False)
+        app.state.agent.checkpointer.delete_thread(oldest)
+
+def sse_event(payload: dict) -> str:
+    """Format a payload as a server-sent event data line"""
+    return f"data: {orjson.dumps(payload, default=str).decode()}\n\n"
+
+def get_query_template(key: tuple, build) -> str:
+    """Return the Cypher text cached under key, building it on first use"""
+    if key not in query_templates:
+        query_templates[key] = build()
+    return query_templates[key]
+
+def search_batch(queries: List[str], k: int) -> List[List[Dict]]:
+    """Embed queries in one pass and run a single FAISS search for all of them"""
+    indexer = app.state.indexer
+    return indexer.search_embeddings(indexer.embed_batch(queries), k)
+
+class SearchCoalescer:
+    """Collects concurrent vector searches into micro-batches run on EMBED_POOL"""
+    
+    def __init__(self, max_batch: int = SEARCH_BATCH_SIZE, max_wait: float = SEARCH_BATCH_WAIT):
+        self.queue = asyncio.Queue()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.task = None
+        self.batches = set()  # Batches in flight, referenced so they aren't garbage collected
+    
+    def start(self):
+        """Start the batching loop on the running event loop"""
+        if self.task is None:
+            self.task = asyncio.create_task(self.loop())
+    
+    async def stop(self):
+        """Cancel the batching loop"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+    
+    async def search(self, query: str, k: int) -> List[Dict]:
+        """Queue a search and wait for its batch to complete"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, k, future))
+        return await future
+    
+    async def next_batch(self) -> list:
+        """Wait for one request, then gather more until the batch is full or max_wait passes"""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def loop(self):
+        """Collect batches and run them concurrently, one per free EMBED_POOL worker"""
+        workers = asyncio.Semaphore(EMBED_WORKERS)
+        while True:
+            batch = await self.next_batch()
+            await workers.acquire()
+            task = asyncio.create_task(self.run_batch(batch, workers))
+            self.batches.add(task)
+            task.add_done_callback(self.batches.discard)
+    
+    async def run_batch(self, batch: list, workers: asyncio.Semaphore):
+        """Run a batch as one embedding pass and one FAISS search, then resolve its futures"""
+        queries = [query for query, _, _ in batch]
+        k = max(k for _, k, _ in batch)
+        
         try:
-            vector_indexer.load_index()
-        except:
-            pass
-    return vector_indexer
+            results = await asyncio.get_running_loop().run_in_executor(EMBED_POOL, search_batch, queries, k)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            workers.release()
+        
+        # Hits are ranked, so a smaller k is a prefix of the batch-wide result
+        for (_, k, future), hits in zip(batch, results):
+            if not future.done():
+                future.set_result(hits[:k])
+
+search_coalescer = SearchCoalescer()
 
 # Tool functions for the AI agent
-def vector_search_tool(query: str, k: int = 5) -> str:
+async def vector_search_tool(query: str, k: int = 5) -> str:
     """
     Semantic search across all nodes using FAISS vector similarity.
     Use this for finding entities by meaning, not exact keywords.
     """
     try:
-        indexer = get_vector_indexer()
-        results = indexer.search(query, k=k)
-        
-        output = f"Found {len(results)} similar entities:\n"
-        for r in results:
-            output += f"- {r['type']}: {r['text']} (score: {r['similarity_score']:.3f})\n"
+        key = (query.strip().lower(), max(1, min(int(k), MAX_VECTOR_K)))
+        if key in vector_search_cache:
+            vector_search_cache.move_to_end(key)
+            results = vector_search_cache[key]
+        else:
+            results = await search_coalescer.search(*key)
+            vector_search_cache[key] = results
+            if len(vector_search_cache) > VECTOR_CACHE_SIZE:
+                vector_search_cache.popitem(last=False)
         
-        return output
+        # Compact JSON of the relevant hits keeps the tool message short for the LLM
+        return dump_tool_json([
+            {"type": r['type'], "text": r['text'], "score": round(r['similarity_score'], 3)}
+            for r in results if r['similarity_score'] > MIN_SIMILARITY
+        ])
     except Exception as e:
         return f"Vector search error: {str(e)}"
 
-def cypher_query_tool(cypher: str) -> str:
+async def cypher_query_tool(cypher: str) -> str:
     """
     Execute a Cypher query on the Neo4j knowledge graph.
     Use for complex graph traversals and pattern matching.
     IMPORTANT: Always use LIMIT to avoid large result sets.
     """
     try:
-        driver = get_neo4j_driver()
+        driver = app.state.driver
         
-        # Add safety limit if not present
-        if "LIMIT" not in cypher.upper():
-            cypher += " LIMIT 10"
+        # Without a LIMIT, stop reading after 10 rows rather than rewriting the query
+        max_records = None if LIMIT_PATTERN.search(cypher) else 10
         
-        with driver.session() as session:
-            result = session.run(cypher)
-            records = [dict(record) for record in result]
-            
-            if not records:
-                return "No results found"
-            
-            return json.dumps(records, indent=2, default=str)
+        # Serialize rows straight off the stream so an oversized result stops at the byte budget
+        output = await driver.execute_query(
+            cypher, result_transformer_=partial(stream_records_to_json, max_records=max_records)
+        )
+        
+        if output == "[]":
+            return "No results found"
+        
+        return output
     
     except Exception as e:
         return f"Cypher query error: {str(e)}"
 
-def get_node_details_tool(node_type: str, node_id: str) -> str:
+async def get_node_details_tool(node_type: str, node_id: str) -> str:
     """
     Get detailed information about a specific node.
     Use when you have an exact node ID from vector search or other queries.
     """
     try:
-        driver = get_neo4j_driver()
+        if node_type not in (await get_graph_schema())["labels"]:
+            return f"Invalid node type: {node_type}"
         
-        with driver.session() as session:
-            query = f"""
-            MATCH (n:{node_type} {{nodeId: $node_id}})
-            OPTIONAL MATCH (n)-[r]->(m)
-            RETURN n, collect({{
-                relationship: type(r),
-                target: labels(m)[0],
-                target_id: m.nodeId
-            }}) as relationships
-            """
-            result = session.run(query, node_id=node_id)
-            record = result.single()
-            
-            if not record:
-                return f"Node {node_type}:{node_id} not found"
-            
-            node_props = dict(record["n"])
-            relationships = record["relationships"]
-            
-            output = f"Node: {node_type} (ID: {node_id})\n"
-            output += f"Properties: {json.dumps(node_props, indent=2, default=str)}\n"
-            output += f"Relationships: {json.dumps(relationships, indent=2)}\n"
-            
-            return output
+        driver = app.state.driver
+        
+        node_query = get_query_template(("node", node_type), lambda: f"""
+        MATCH (n:{node_type} {{nodeId: $node_id}})
+        RETURN n
+        """)
+        rel_query = get_query_template(("node_relationships", node_type), lambda: f"""
+        MATCH (n:{node_type} {{nodeId: $node_id}})-[r]->(m)
+        RETURN type(r) as relationship, labels(m)[0] as target, m.nodeId as target_id
+        LIMIT {MAX_NODE_RELATIONSHIPS}
+        """)
+        
+        # Fetch properties and relationships concurrently
+        async with asyncio.TaskGroup() as tg:
+            node_task = tg.create_task(
+                driver.execute_query(node_query, node_id=node_id, result_transformer_=AsyncResult.data)
+            )
+            rel_task = tg.create_task(
+                driver.execute_query(rel_query, node_id=node_id, result_transformer_=AsyncResult.data)
+            )
+        records = node_task.result()
+        
+        if not records:
+            return f"Node {node_type}:{node_id} not found"
+        
+        node_props = records[0]["n"]
+        relationships = rel_task.result()
+        
+        output = f"Node: {node_type} (ID: {node_id})\n"
+        output += f"Properties: {dump_tool_json(node_props)}\n"
+        output += f"Relationships: {dump_tool_json(relationships)}\n"
+        
+        return output
     
     except Exception as e:
-        return f"Error getting node details: {str(e)}"
+        return f"Error getting node details: {error_message(e)}"
 
-def graph_stats_tool() -> str:
+async def graph_stats_tool() -> str:
     """
     Get statistics about the knowledge graph (node counts, relationship counts).
     Use to understand the graph structure and size.
     """
     try:
-        driver = get_neo4j_driver()
+        # Graph structure rarely changes between agent turns, so reuse recent stats
+        if graph_stats_cache["output"] and time.monotonic() < graph_stats_cache["expires_at"]:
+            return graph_stats_cache["output"]
+        
+        driver = app.state.driver
         
-        with driver.session() as session:
-            # Node counts
+        try:
+            # APOC reads node and relationship counts from the count store in one round-trip
+            records, _, _ = await driver.execute_query(
+                "CALL apoc.meta.stats() YIELD labels, relTypesCount RETURN labels, relTypesCount"
+            )
+            nodes = sorted(records[0]["labels"].items(), key=lambda item: item[1], reverse=True)
+            rels = sorted(records[0]["relTypesCount"].items(), key=lambda item: item[1], reverse=True)
+        except ClientError:
+            # APOC not installed: fall back to scanning the graph, running both scans concurrently
             node_query = "MATCH (n) RETURN labels(n)[0] as type, count(n) as count ORDER BY count DESC"
-            nodes = [dict(r) for r in session.run(node_query)]
-            
-            # Relationship counts
             rel_query = "MATCH ()-[r]->() RETURN type(r) as type, count(r) as count ORDER BY count DESC"
-            rels = [dict(r) for r in session.run(rel_query)]
-            
-            output = "Knowledge Graph Statistics:\n\n"
-            output += "Nodes:\n"
-            for n in nodes:
-                output += f"  - {n['type']}: {n['count']}\n"
-            output += "\nRelationships:\n"
-            for r in rels:
-                output += f"  - {r['type']}: {r['count']}\n"
+            async with asyncio.TaskGroup() as tg:
+                node_task = tg.create_task(driver.execute_query(node_query))
+                rel_task = tg.create_task(driver.execute_query(rel_query))
             
-            return output
+            nodes = [(r["type"], r["count"]) for r in node_task.result().records]
+            rels = [(r["type"], r["count"]) for r in rel_task.result().records]
+        
+        output = "Knowledge Graph Statistics:\n\n"
+        output += "Nodes:\n"
+        for node_type, count in nodes:
+            output += f"  - {node_type}: {count}\n"
+        output += "\nRelationships:\n"
+        for rel_type, count in rels:
+            output += f"  - {rel_type}: {count}\n"
+        
+        graph_stats_cache["output"] = output
+        graph_stats_cache["expires_at"] = time.monotonic() + GRAPH_STATS_TTL
+        return output
     
     except Exception as e:
-        return f"Error getting stats: {str(e)}"
+        return f"Error getting stats: {error_message(e)}"
 
-def filter_nodes_tool(node_type: str, filters: str) -> str:
+async def filter_nodes_tool(node_type: str, filters: str) -> str:
     """
     Filter nodes by exact property values.
     filters should be JSON like: {"status": "paid", "totalAmount": ">1000"}
     Use for precise filtering by known values.
     """
     try:
-        driver = get_neo4j_driver()
+        schema = await get_graph_schema()
+        if node_type not in schema["labels"]:
+            return f"Invalid node type: {node_type}"
+        
+        driver = app.state.driver
         filter_dict = json.loads(filters)
         
-        # Build WHERE clause
-        where_clauses = []
-        params = {}
+        # Property names can't be query parameters, so only allow keys that exist on this label
+        unknown_keys = [key for key in filter_dict if key not in schema["properties"][node_type]]
+        if unknown_keys:
+            return f"Invalid properties for {node_type}: {', '.join(map(str, unknown_keys))}"
         
+        # Parse filters into (property, operator) pairs; sorting them gives one query text
+        # per combination regardless of the order the LLM listed them in
+        conditions = []
         for key, value in filter_dict.items():
             if isinstance(value, str) and value.startswith(">"):
-                where_clauses.append(f"n.{key} > ${key}")
-                params[key] = float(value[1:])
+                conditions.append((key, ">", float(value[1:])))
             elif isinstance(value, str) and value.startswith("<"):
-                where_clauses.append(f"n.{key} < ${key}")
-                params[key] = float(value[1:])
+                conditions.append((key, "<", float(value[1:])))
             else:
-                where_clauses.append(f"n.{key} = ${key}")
-                params[key] = value
+                conditions.append((key, "=", value))
+        conditions.sort(key=lambda condition: (condition[0], condition[1]))
         
-        where_clause = " AND ".join(where_clauses)
+        signature = tuple((key, op) for key, op, _ in conditions)
+        params = {f"p{i}": value for i, (_, _, value) in enumerate(conditions)}
         
-        query = f"""
-        MATCH (n:{node_type})
-        WHERE {where_clause}
-        RETURN n
-        LIMIT 20
-        """
+        def build_query():
+            # Values are always parameters so Neo4j can reuse the cached plan
+            where_clause = " AND ".join(f"n.`{key}` {op} $p{i}" for i, (key, op) in enumerate(signature))
+            return f"""
+            MATCH (n:{node_type})
+            {"WHERE " + where_clause if where_clause else ""}
+            RETURN n
+            LIMIT 20
+            """
         
-        with driver.session() as session:
-            result = session.run(query, params)
-            records = [dict(record["n"]) for record in result]
-            
-            return json.dumps(records, indent=2, default=str)
+        query = get_query_template(("filter_nodes", node_type, signature), build_query)
+        
+        return await driver.execute_query(
+            query, params, result_transformer_=partial(stream_records_to_json, key="n")
+        )
     
     except Exception as e:
         return f"Filter error: {str(e)}"
@@ -248,27 +531,32 @@ def create_ai_agent():
     tools = [
         Tool(
             name="vector_search",
-            func=vector_search_tool,
+            func=None,
+            coroutine=vector_search_tool,
             description="Semantic search to find similar entities by meaning. Use for: 'find products like...', 'customers who...', etc."
         ),
         Tool(
             name="cypher_query",
-            func=cypher_query_tool,
+            func=None,
+            coroutine=cypher_query_tool,
             description="Execute Cypher queries for graph traversals. Use for: relationships, paths, complex patterns."
         ),
         Tool(
             name="get_node_details",
-            func=get_node_details_tool,
+            func=None,
+            coroutine=get_node_details_tool,
             description="Get detailed info about a specific node. Use when you have an exact node ID."
         ),
         Tool(
             name="graph_stats",
-            func=graph_stats_tool,
+            func=None,
+            coroutine=graph_stats_tool,
             description="Get graph statistics. Use to understand the graph structure."
         ),
         Tool(
             name="filter_nodes",
-            func=filter_nodes_tool,
+            func=None,
+            coroutine=filter_nodes_tool,
             description="Filter nodes by exact property values. Use for precise filtering."
         )
     ]
@@ -281,12 +569,12 @@ def create_ai_agent():
 
 # API Endpoints
 
-@app.get("/")
+@app.get("/", response_class=ORJSONResponse)
 def root():
     return {
         "service": "Knowledge Graph RAG API",
         "version": "2.0.0",
-        "graph_built": graph_built,
+        "graph_built": app.state.graph_built,
         "endpoints": {
             "POST /build-graph": "Build knowledge graph from PostgreSQL",
             "POST /chat": "Chat with AI agent",
@@ -295,25 +583,25 @@ def root():
         }
     }
 
-@app.get("/health")
-def health_check():
+@app.get("/health", response_class=ORJSONResponse)
+async def health_check():
     """Check system health"""
     status = {
         "api": "healthy",
         "neo4j": "disconnected",
         "vector_index": "not loaded",
-        "graph_built": graph_built
+        "graph_built": app.state.graph_built
     }
     
     try:
-        driver = get_neo4j_driver()
-        driver.verify_connectivity()
+        driver = app.state.driver
+        await driver.verify_connectivity()
         status["neo4j"] = "connected"
     except:
         pass
     
     try:
-        indexer = get_vector_indexer()
+        indexer = app.state.indexer
         if indexer.index is not None:
             status["vector_index"] = f"loaded ({indexer.index.ntotal} vectors)"
     except:
@@ -327,79 +615,43 @@ async def build_graph(request: BuildGraphRequest, background_tasks: BackgroundTa
     Build knowledge graph from PostgreSQL database
     Creates schema, ontology, Neo4j graph, and FAISS vector index
     """
-    global graph_built
-    
     def build_pipeline(conn_string: str):
-        global graph_built, vector_indexer
-        
         try:
             print("Starting graph build pipeline...")
             
-            # Update environment
-            os.environ["DATABASE_URL"] = conn_string
-            
-            # Get current working directory
-            work_dir = os.path.dirname(os.path.abspath(__file__)) if os.path.dirname(__file__) else os.getcwd()
+            neo4j_uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
+            neo4j_user = os.getenv("NEO4J_USER", "neo4j")
+            neo4j_password = os.getenv("NEO4J_PASSWORD", "password")
             
+            # Each stage runs in-process and raises on failure
             # 1. Extract schema
             print("1. Extracting schema...")
-            result = subprocess.run(
-                [sys.executable, "schema_extractor.py"],
-                cwd=work_dir,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout or "Unknown error"
-                print(f"Schema extraction error: {error_msg}")
-                raise Exception(f"Schema extraction failed: {error_msg}")
+            schema_extractor.run(conn_string)
             print("✓ Schema extracted successfully")
             
             # 2. Generate ontology
             print("2. Generating ontology...")
-            result = subprocess.run(
-                [sys.executable, "schema_to_ontology.py"],
-                cwd=work_dir,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout or "Unknown error"
-                print(f"Ontology generation error: {error_msg}")
-                raise Exception(f"Ontology generation failed: {error_msg}")
+            schema_to_ontology.run()
             print("✓ Ontology generated successfully")
             
             # 3. Build Neo4j graph
             print("3. Building Neo4j graph...")
-            result = subprocess.run(
-                [sys.executable, "create_knowledge_graph.py", "--auto"],
-                cwd=work_dir,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout or "Unknown error"
-                print(f"Graph creation error: {error_msg}")
-                raise Exception(f"Graph creation failed: {error_msg}")
+            create_knowledge_graph.run(neo4j_uri, neo4j_user, neo4j_password, rebuild=True)
             print("✓ Neo4j graph created successfully")
             
             # 4. Build FAISS vector index
             print("4. Building vector index...")
             indexer = VectorIndexer()
-            neo4j_uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-            neo4j_user = os.getenv("NEO4J_USER", "neo4j")
-            neo4j_password = os.getenv("NEO4J_PASSWORD", "password")
-            
             indexer.build_index_from_neo4j(neo4j_uri, neo4j_user, neo4j_password)
             indexer.save_index()
             print("✓ Vector index built successfully")
             
-            # Update global state
-            vector_indexer = indexer
-            graph_built = True
+            # Update shared state
+            app.state.indexer = indexer
+            app.state.graph_built = True
+            graph_stats_cache["output"] = None
+            graph_schema["labels"] = None
+            vector_search_cache.clear()
             
             print("="*50)
             print("✓ GRAPH BUILD PIPELINE COMPLETED SUCCESSFULLY!")
@@ -409,7 +661,7 @@ async def build_graph(request: BuildGraphRequest, background_tasks: BackgroundTa
             print("="*50)
             print(f"✗ ERROR IN BUILD PIPELINE: {e}")
             print("="*50)
-            graph_built = False
+            app.state.graph_built = False
     
     # Run in background
     background_tasks.add_task(build_pipeline, request.connection_string)
@@ -429,11 +681,11 @@ async def build_graph(request: BuildGraphRequest, background_tasks: BackgroundTa
         }
     }
 
-@app.get("/stats")
-def get_stats():
+@app.get("/stats", response_class=ORJSONResponse)
+async def get_stats():
     """Get graph statistics"""
     try:
-        stats = graph_stats_tool()
+        stats = await graph_stats_tool()
         return {"stats": stats}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -444,78 +696,82 @@ async def chat(request: ChatRequest):
     Chat with AI agent
     The agent intelligently selects tools based on query complexity
     """
+    # Shed load fast when every slot is busy
+    if CHAT_SEM.locked():
+        raise HTTPException(status_code=503, detail="Server busy, please retry shortly")
+    await CHAT_SEM.acquire()
+    released = False
+    streaming = False
+    
+    def release_slot():
+        """Give the slot back exactly once, whichever path gets there first"""
+        nonlocal released
+        if not released:
+            released = True
+            CHAT_SEM.release()
     
     try:
-        # Create agent
-        agent = create_ai_agent()
+        # Reuse the agent built at startup so its memory persists across requests
+        agent = app.state.agent
+        thread_id = request.thread_id or uuid.uuid4().hex
+        track_thread(thread_id)
         
-        # System message to guide agent
-        system_prompt = """You are a knowledge graph AI assistant. You have access to tools for:
-- vector_search: Semantic search for finding similar entities
-- cypher_query: Graph traversals and pattern matching
-- get_node_details: Detailed node information
-- filter_nodes: Precise filtering by properties
-- graph_stats: Graph statistics
-
-Choose tools intelligently based on the query:
-- Use vector_search for semantic/fuzzy queries
-- Use cypher_query for relationships and paths
-- Use filter_nodes for exact matches
-- Combine tools when needed
-
-Always explain your reasoning and cite sources."""
-
-        full_query = f"{system_prompt}\n\nUser query: {request.query}"
+        config = {**AGENT_CONFIG, "configurable": {"thread_id": thread_id}}
+        messages = [SYSTEM_MESSAGE, HumanMessage(content=request.query)]
         
         if request.stream:
             # Streaming response
             async def generate():
-                reasoning_steps = []
-                
-                config = {
-                    "configurable": {"thread_id": "default"},
-                    "recursion_limit": 50  # Increase recursion limit
-                }
-                
-                async for chunk in agent.astream(
-                    {"messages": [("user", full_query)]},
-                    config=config
-                ):
-                    if "agent" in chunk:
-                        # Agent reasoning
-                        messages = chunk["agent"].get("messages", [])
-                        for msg in messages:
-                            content = str(msg.content) if hasattr(msg, 'content') else str(msg)
-                            if content:
-                                yield f"data: {json.dumps({'type': 'reasoning', 'content': content})}\n\n"
+                # The slot is held until the stream finishes
+                try:
+                    yield sse_event({'type': 'thread', 'thread_id': thread_id})
+                    async for chunk in agent.astream(
+                        {"messages": messages},
+                        config=config
+                    ):
+                        if "agent" in chunk:
+                            # Agent reasoning
+                            for msg in chunk["agent"].get("messages", []):
+                                content = str(msg.content) if hasattr(msg, 'content') else str(msg)
+                                if content:
+                                    yield sse_event({'type': 'reasoning', 'content': content})
+                        
+                        elif "tools" in chunk:
+                            # Tool execution
+                            for tool_call in chunk.get("tools", {}).get("messages", []):
+                                tool_name = getattr(tool_call, 'name', 'unknown')
+                                yield sse_event({'type': 'tool', 'tool': tool_name})
                     
-                    elif "tools" in chunk:
-                        # Tool execution
-                        for tool_call in chunk.get("tools", {}).get("messages", []):
-                            tool_name = getattr(tool_call, 'name', 'unknown')
-                            yield f"data: {json.dumps({'type': 'tool', 'tool': tool_name})}\n\n"
-                
-                yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                    yield sse_event({'type': 'done'})
+                finally:
+                    release_slot()
             
-            return StreamingResponse(generate(), media_type="text/event-stream")
+            # The background task also runs when the client goes away before the
+            # generator is ever iterated, where the generator's finally wouldn't
+            response = StreamingResponse(generate(), media_type="text/event-stream",
+                                         background=BackgroundTask(release_slot))
+            streaming = True
+            return response
         
         else:
             # Non-streaming response
-            config = {
-                "configurable": {"thread_id": "default"},
-                "recursion_limit": 50  # Increase recursion limit
-            }
             result = await agent.ainvoke(
-                {"messages": [("user", full_query)]},
+                {"messages": messages},
                 config=config
             )
             
             messages = result.get("messages", [])
+            
+            # A continued thread returns its whole history; summarize only this turn
+            turn_start = next((i for i in range(len(messages) - 1, -1, -1)
+                               if isinstance(messages[i], HumanMessage)), -1)
+            messages = messages[turn_start + 1:]
             final_response = messages[-1].content if messages else "No response"
             
             # Ensure response is a string
             if isinstance(final_response, list):
                 final_response = "\n".join(str(item) for item in final_response)
+            final_response = str(final_response)
             
             # Extract tool usage and reasoning from messages
             tools_used = []
@@ -523,31 +779,28 @@ Always explain your reasoning and cite sources."""
             all_sources = []
             
             for msg in messages:
-                # Track tool calls from AI messages
-                if hasattr(msg, 'tool_calls') and msg.tool_calls:
+                if isinstance(msg, AIMessage):
+                    # Track tool calls
                     for tool_call in msg.tool_calls:
                         tool_name = tool_call.get('name', 'unknown')
                         if tool_name not in tools_used:
                             tools_used.append(tool_name)
                             reasoning_steps.append(f"Using tool: {tool_name}")
-                
-                # Track AI reasoning steps
-                if hasattr(msg, 'type'):
-                    if msg.type == 'ai' and hasattr(msg, 'content'):
-                        content = str(msg.content)
-                        if content and len(content) > 20 and content != str(final_response):
-                            # Only add if it's meaningful reasoning, not the final answer
-                            reasoning_steps.append(content[:200] + "..." if len(content) > 200 else content)
                     
+                    # Track AI reasoning steps
+                    content = str(msg.content)
+                    if content and len(content) > 20 and content != final_response:
+                        # Only add if it's meaningful reasoning, not the final answer
+                        reasoning_steps.append(content[:200] + "..." if len(content) > 200 else content)
+                
+                elif isinstance(msg, ToolMessage):
                     # Track tool outputs
-                    elif msg.type == 'tool' and hasattr(msg, 'content'):
-                        tool_name = getattr(msg, 'name', 'unknown_tool')
-                        tool_content = str(msg.content)
-                        all_sources.append({
-                            "tool": tool_name,
-                            "content": tool_content,
-                            "is_error": "Error:" in tool_content or "error" in tool_content.lower()[:100]
-                        })
+                    tool_content = str(msg.content)
+                    all_sources.append({
+                        "tool": msg.name or 'unknown_tool',
+                        "content": tool_content,
+                        "is_error": "Error:" in tool_content or "error" in tool_content.lower()[:100]
+                    })
             
             # Filter sources: only keep successful tool outputs (no errors)
             # Prefer the last successful tool call as it likely provided the answer
@@ -564,21 +817,64 @@ Always explain your reasoning and cite sources."""
                 }]
             
             return ChatResponse(
-                response=str(final_response),
+                response=final_response,
                 reasoning=reasoning_steps if reasoning_steps else ["Query processed by AI agent"],
                 tools_used=tools_used if tools_used else ["direct_response"],
-                sources=final_sources
+                sources=final_sources,
+                thread_id=thread_id
             )
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    finally:
+        if not streaming:
+            release_slot()
+
+def preload_file(path: str):
+    """Pull a file into the OS page cache"""
+    with open(path, 'rb') as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        else:
+            # No fadvise (e.g. macOS): a sequential read has the same effect
+            while f.read(1 << 20):
+                pass
+
+@app.on_event("startup")
+async def startup():
+    """Build the AI agent and open connections once, before the first request"""
+    torch.set_num_threads(1)
+    faiss.omp_set_num_threads(os.cpu_count())
+    app.state.graph_built = True  # Set to True since graph already exists
+    app.state.driver = create_neo4j_driver()
+    app.state.indexer = create_vector_indexer()
+    app.state.agent = create_ai_agent()
+    
+    # Connect and warm up now so the first chat doesn't pay for it
+    try:
+        await app.state.driver.verify_connectivity()
+        await get_graph_schema()
+        print("✓ Connected to Neo4j")
+    except Exception as e:
+        print(f"⚠ Neo4j not reachable at startup: {e}")
+    
+    indexer = app.state.indexer
+    if indexer.index is not None:
+        # A memory-mapped index is read ahead so searches don't page-fault
+        if indexer.mmap_path:
+            preload_file(indexer.mmap_path)
+        # Warm up the embedding model
+        indexer.search("warmup", k=1)
+    
+    search_coalescer.start()
 
 @app.on_event("shutdown")
-def shutdown():
+async def shutdown():
     """Clean up resources"""
-    global neo4j_driver
-    if neo4j_driver:
-        neo4j_driver.close()
+    await search_coalescer.stop()
+    await app.state.driver.close()
+    EMBED_POOL.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,7 +1,15 @@
 import psycopg
+from psycopg import sql
 import json
+import orjson
 import os
-import csv
+import re
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+from psycopg_pool import ConnectionPool
 from dotenv import load_dotenv
 from decimal import Decimal
 from datetime import datetime, date
@@ -9,17 +17,69 @@ from datetime import datetime, date
 # Load environment variables
 load_dotenv()
 
+# Write buffer for CSV exports, so large tables go to disk in few large writes
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Tables estimated below this many rows are sampled with ORDER BY RANDOM() instead of TABLESAMPLE
+SMALL_TABLE_ROWS = 1000
+
+# Executions of the same query text before psycopg prepares it server-side
+PREPARE_THRESHOLD = 1
+
+# Tables, foreign keys and implicit relationships shown in the schema preview printed by main()
+PREVIEW_ENTRIES = 3
+
+# Tables extracted concurrently, each on its own pooled connection
+TABLE_WORKERS = 8
+
+# Hashes kept per column sketch when prefiltering implicit-relationship candidates
+SIGNATURE_SIZE = 128
+
+# Fewest of column 1's hashes in the union sample for a containment estimate to mean anything
+MIN_SKETCH_SAMPLE = 16
+
+def estimate_containment(signature1, signature2, size=SIGNATURE_SIZE):
+    """Estimate the fraction of column 1's distinct values in column 2 from bottom-k sketches (None if unknown)"""
+    # The smallest hashes of the union are a uniform sample of both columns' distinct values;
+    # signatures are sorted and unique, so the sample is every hash up to the union's size-th
+    union = np.union1d(signature1, signature2)
+    cutoff = union[min(size, len(union)) - 1] if len(union) else 0
+    sampled1 = signature1[:np.searchsorted(signature1, cutoff, side='right')]
+    # A small column next to a large one (the usual foreign key) contributes few or no hashes
+    if len(sampled1) < MIN_SKETCH_SAMPLE:
+        return None
+    return np.intersect1d(sampled1, signature2, assume_unique=True).size / sampled1.size
+
 class SchemaExtractor:
     def __init__(self, connection_string):
         self.connection_string = connection_string
         self.conn = None
+        self.pool = None
+        self.local = threading.local()
         self.cursor = None
     
+    @property
+    def cursor(self):
+        """Cursor for the calling thread: the main connection's, or a worker's pooled one"""
+        return getattr(self.local, 'cursor', None)
+    
+    @cursor.setter
+    def cursor(self, cursor):
+        self.local.cursor = cursor
+    
     def connect(self):
         """Establish database connection"""
         try:
-            self.conn = psycopg.connect(self.connection_string)
+            # Prepare statements the first time they repeat, so the per-table catalog queries are planned once
+            self.conn = psycopg.connect(self.connection_string, prepare_threshold=PREPARE_THRESHOLD)
             self.cursor = self.conn.cursor()
+            self.pool = ConnectionPool(
+                self.connection_string,
+                min_size=1,
+                max_size=TABLE_WORKERS,
+                kwargs={"prepare_threshold": PREPARE_THRESHOLD},
+                open=True
+            )
             print("Connected to database successfully!")
         except Exception as e:
             print(f"Error connecting to database: {e}")
@@ -37,34 +97,40 @@ class SchemaExtractor:
         self.cursor.execute(query)
         return [row[0] for row in self.cursor.fetchall()]
     
-    def get_columns(self, table_name):
-        """Get all columns for a specific table"""
+    def get_all_columns(self):
+        """Get the columns of every public table, with primary key flags, in one query"""
         query = """
+            WITH primary_keys AS (
+                SELECT cls.relname AS table_name, a.attname AS column_name
+                FROM pg_index i
+                JOIN pg_class cls ON cls.oid = i.indrelid
+                JOIN pg_namespace n ON n.oid = cls.relnamespace
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                WHERE i.indisprimary
+                AND n.nspname = 'public'
+            )
             SELECT 
+                c.table_name,
                 c.column_name,
                 c.data_type,
                 c.character_maximum_length,
                 c.is_nullable,
-                c.column_default
+                c.column_default,
+                pk.column_name IS NOT NULL AS is_pk
             FROM information_schema.columns c
-            WHERE c.table_schema = 'public' 
-            AND c.table_name = %s
-            ORDER BY c.ordinal_position;
-        """
-        self.cursor.execute(query, (table_name,))
-        return self.cursor.fetchall()
-    
-    def get_primary_keys(self, table_name):
-        """Get primary key columns for a table"""
-        query = """
-            SELECT a.attname
-            FROM pg_index i
-            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
-            WHERE i.indrelid = %s::regclass
-            AND i.indisprimary;
+            LEFT JOIN primary_keys pk
+              ON pk.table_name = c.table_name
+              AND pk.column_name = c.column_name
+            WHERE c.table_schema = 'public'
+            ORDER BY c.table_name, c.ordinal_position;
         """
-        self.cursor.execute(query, (f'public.{table_name}',))
-        return [row[0] for row in self.cursor.fetchall()]
+        self.cursor.execute(query)
+        
+        # Rows are ordered by table, so grouping yields each table's columns in ordinal order
+        return {
+            table_name: [row[1:] for row in rows]
+            for table_name, rows in groupby(self.cursor.fetchall(), key=itemgetter(0))
+        }
     
     def get_foreign_keys(self):
         """Get all foreign key relationships in the database"""
@@ -89,23 +155,28 @@ class SchemaExtractor:
         self.cursor.execute(query)
         return self.cursor.fetchall()
     
+    def get_estimated_row_count(self, table_name):
+        """Planner's row estimate for a table (-1 or 0 if it has never been analyzed)"""
+        self.cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", (f'public."{table_name}"',))
+        return self.cursor.fetchone()[0]
+    
     def get_sample_rows(self, table_name, limit=2):
         """Get random sample rows from a table"""
         try:
-            # First check if table has any rows
-            count_query = f'SELECT COUNT(*) FROM "{table_name}";'
-            self.cursor.execute(count_query)
-            row_count = self.cursor.fetchone()[0]
-            
-            if row_count == 0:
-                return []
+            # Use the planner estimate rather than COUNT(*), which scans the whole table
+            estimated_rows = self.get_estimated_row_count(table_name)
             
-            # Limit sample size to available rows
-            sample_size = min(limit, row_count)
-            
-            # Get random sample
-            query = f'SELECT * FROM "{table_name}" ORDER BY RANDOM() LIMIT {sample_size};'
-            self.cursor.execute(query)
+            # Identifiers are composed and values passed as parameters, so the text is the same for every call
+            if estimated_rows < SMALL_TABLE_ROWS:
+                # Small (or never analyzed) table: sorting it randomly is cheap
+                query = sql.SQL('SELECT * FROM {} ORDER BY RANDOM() LIMIT %s;').format(sql.Identifier(table_name))
+                params = (limit,)
+            else:
+                # Sample roughly 10x the rows needed instead of sorting the whole table
+                percent = min(100.0, 100.0 * limit * 10 / estimated_rows)
+                query = sql.SQL('SELECT * FROM {} TABLESAMPLE BERNOULLI (%s) LIMIT %s;').format(sql.Identifier(table_name))
+                params = (percent, limit)
+            self.cursor.execute(query, params)
             
             # Get column names
             colnames = [desc[0] for desc in self.cursor.description]
@@ -136,33 +207,12 @@ class SchemaExtractor:
         try:
             csv_filename = f"{table_name}.csv"
             
-            # Get all rows from table
-            query = f'SELECT * FROM "{table_name}";'
-            self.cursor.execute(query)
-            
-            # Get column names
-            colnames = [desc[0] for desc in self.cursor.description]
-            
-            # Write to CSV
-            with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(colnames)  # Header
-                
-                for row in self.cursor.fetchall():
-                    # Convert values for CSV
-                    csv_row = []
-                    for val in row:
-                        if isinstance(val, Decimal):
-                            csv_row.append(float(val))
-                        elif isinstance(val, (datetime, date)):
-                            csv_row.append(val.isoformat())
-                        elif isinstance(val, bytes):
-                            csv_row.append(val.hex())
-                        elif val is None:
-                            csv_row.append('')
-                        else:
-                            csv_row.append(val)
-                    writer.writerow(csv_row)
+            # COPY streams server-encoded CSV (header included) straight into the file,
+            # so the table is never held in memory and no per-value conversion runs here
+            query = sql.SQL('COPY {} TO STDOUT WITH (FORMAT CSV, HEADER)').format(sql.Identifier(table_name))
+            with open(csv_filename, 'wb', buffering=WRITE_BUFFER_SIZE) as csvfile, self.cursor.copy(query) as copy:
+                for data in copy:
+                    csvfile.write(data)
             
             return csv_filename
         except Exception as e:
@@ -174,56 +224,85 @@ class SchemaExtractor:
         try:
             csv_filename = f"{relationship_type}_{from_table}_{from_column}_to_{to_table}_{to_column}.csv"
             
-            # Query to get relationship data
-            query = f'''
-                SELECT 
-                    t1."{from_column}" as from_value,
-                    t2."{to_column}" as to_value
-                FROM "{from_table}" t1
-                LEFT JOIN "{to_table}" t2 ON t1."{from_column}" = t2."{to_column}"
-                WHERE t1."{from_column}" IS NOT NULL
-                ORDER BY t1."{from_column}";
-            '''
-            self.cursor.execute(query)
+            # Query to get relationship data; the aliases become the CSV header
+            query = sql.SQL('''
+                COPY (
+                    SELECT 
+                        t1.{from_column} as {from_header},
+                        t2.{to_column} as {to_header}
+                    FROM {from_table} t1
+                    LEFT JOIN {to_table} t2 ON t1.{from_column} = t2.{to_column}
+                    WHERE t1.{from_column} IS NOT NULL
+                    ORDER BY t1.{from_column}
+                ) TO STDOUT WITH (FORMAT CSV, HEADER)
+            ''').format(
+                from_table=sql.Identifier(from_table),
+                from_column=sql.Identifier(from_column),
+                to_table=sql.Identifier(to_table),
+                to_column=sql.Identifier(to_column),
+                from_header=sql.Identifier(f"{from_table}.{from_column}"),
+                to_header=sql.Identifier(f"{to_table}.{to_column}")
+            )
             
-            # Write to CSV
-            with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow([f'{from_table}.{from_column}', f'{to_table}.{to_column}'])
-                
-                for row in self.cursor.fetchall():
-                    csv_row = []
-                    for val in row:
-                        if isinstance(val, Decimal):
-                            csv_row.append(float(val))
-                        elif isinstance(val, (datetime, date)):
-                            csv_row.append(val.isoformat())
-                        elif isinstance(val, bytes):
-                            csv_row.append(val.hex())
-                        elif val is None:
-                            csv_row.append('')
-                        else:
-                            csv_row.append(val)
-                    writer.writerow(csv_row)
+            # Stream server-encoded CSV into the file, as for table exports
+            with open(csv_filename, 'wb', buffering=WRITE_BUFFER_SIZE) as csvfile, self.cursor.copy(query) as copy:
+                for data in copy:
+                    csvfile.write(data)
             
             return csv_filename
         except Exception as e:
             print(f"Error exporting relationship {from_table}.{from_column} -> {to_table}.{to_column}: {e}")
             return None
     
-    def get_distinct_values(self, table_name, column_name, limit=1000):
-        """Get distinct non-null values from a column (limited for performance)"""
+    def get_column_signature(self, table_name, column_name, size=SIGNATURE_SIZE):
+        """Bottom-k sketch of a column: the smallest hashes of its distinct non-null values"""
+        try:
+            query = sql.SQL('''
+                SELECT DISTINCT hashtext({column}::text) AS h
+                FROM {table}
+                WHERE {column} IS NOT NULL
+                ORDER BY h
+                LIMIT %s;
+            ''').format(column=sql.Identifier(column_name), table=sql.Identifier(table_name))
+            self.cursor.execute(query, (size,))
+            # Rows arrive sorted and distinct, which estimate_containment relies on
+            return np.fromiter((row[0] for row in self.cursor), dtype=np.int64)
+        except Exception as e:
+            print(f"Error computing signature of {table_name}.{column_name}: {e}")
+            return None
+    
+    def get_overlaps(self, table1, column1, targets, limit=1000):
+        """Count distinct values of table1.column1 (up to limit) and how many of them occur in each (table, column) target"""
         try:
-            query = f'SELECT DISTINCT "{column_name}" FROM "{table_name}" WHERE "{column_name}" IS NOT NULL LIMIT {limit};'
-            self.cursor.execute(query)
-            return set(row[0] for row in self.cursor.fetchall())
+            # The server scans the source column's distinct values once and probes every target,
+            # so no values are fetched and each source column is read a single time
+            probes = sql.SQL(",\n").join(
+                sql.SQL('''count(*) FILTER (WHERE EXISTS (
+                        SELECT 1 FROM {table} t2 WHERE t2.{column} = s.value
+                    ))''').format(table=sql.Identifier(table2), column=sql.Identifier(column2))
+                for table2, column2 in targets
+            )
+            query = sql.SQL('''
+                SELECT
+                    count(*) AS distinct_count,
+                    {probes}
+                FROM (
+                    SELECT DISTINCT {column} AS value
+                    FROM {table}
+                    WHERE {column} IS NOT NULL
+                    LIMIT %s
+                ) s;
+            ''').format(probes=probes, column=sql.Identifier(column1), table=sql.Identifier(table1))
+            self.cursor.execute(query, (limit,))
+            row = self.cursor.fetchone()
+            return row[0], list(row[1:])
         except Exception as e:
-            print(f"Error getting distinct values from {table_name}.{column_name}: {e}")
-            return set()
+            print(f"Error measuring overlap of {table1}.{column1}: {e}")
+            return 0, [0] * len(targets)
     
-    def find_implicit_relationships(self, tables_info, explicit_fks, threshold=0.8):
-        """Find implicit relationships by analyzing value overlap between columns"""
-        implicit_relationships = []
+    def get_candidate_pairs(self, tables_info, explicit_fks):
+        """List (table1, column1, table2, column2) pairs that could be implicit relationships, from the schema alone"""
+        candidate_pairs = []
         
         # Build a comprehensive set of relationships already covered by explicit FKs
         # Include both direct FKs and columns involved in FK relationships
@@ -238,93 +317,158 @@ class SchemaExtractor:
         
         # Columns that are typically data values, not relationships
         excluded_patterns = ['price', 'amount', 'total', 'quantity', 'count', 'status', 'name', 'description', 'email', 'phone']
+        excluded_pattern = re.compile('|'.join(excluded_patterns))
         
-        print("\nAnalyzing implicit relationships...")
+        # Classify every column once: which can reference another table, and which can be referenced
+        sources = {}
+        targets = {}
+        for table_name, table_info in tables_info.items():
+            sources[table_name] = []
+            targets[table_name] = []
+            for col in table_info['columns']:
+                # Skip audit columns, columns already in explicit FKs, and
+                # columns whose name suggests a data value rather than a relationship
+                if col['name'] in excluded_columns or (table_name, col['name']) in covered_columns:
+                    continue
+                if excluded_pattern.search(col['name'].lower()):
+                    continue
+                
+                targets[table_name].append(col)
+                # Primary keys are never the referencing side
+                if not col['pk']:
+                    sources[table_name].append(col)
         
         # Compare columns across different tables
         table_names = list(tables_info.keys())
         for i, table1 in enumerate(table_names):
             for table2 in table_names[i+1:]:
-                cols1 = tables_info[table1]['columns']
-                cols2 = tables_info[table2]['columns']
-                
-                # Get primary key columns for table2 (potential targets)
-                pk_cols2 = {col['name'] for col in cols2 if col['pk']}
-                
-                for col1 in cols1:
-                    # Skip primary keys and audit columns
-                    if col1['pk'] or col1['name'] in excluded_columns:
-                        continue
-                    
-                    # Skip columns already in explicit FKs
-                    if (table1, col1['name']) in covered_columns:
-                        continue
+                for col1 in sources[table1]:
+                    name1 = col1['name']
                     
-                    # Skip if column name suggests it's a data value, not a relationship
-                    if any(pattern in col1['name'].lower() for pattern in excluded_patterns):
-                        continue
+                    # col1 looks like a foreign key, or its name matches table2 by naming convention
+                    references_table2 = (
+                        name1.endswith(('_id', '_sku')) or
+                        name1.replace('_id', '') in table2 or
+                        name1.replace('_sku', '') in table2
+                    )
                     
-                    for col2 in cols2:
-                        # Skip audit columns
-                        if col2['name'] in excluded_columns:
-                            continue
-                        
-                        # Skip if column already in explicit FKs
-                        if (table2, col2['name']) in covered_columns:
-                            continue
-                        
+                    for col2 in targets[table2]:
                         # Skip if different types
                         if col1['type'] != col2['type']:
                             continue
                         
-                        # Skip if column name suggests it's a data value
-                        if any(pattern in col2['name'].lower() for pattern in excluded_patterns):
-                            continue
-                        
                         # Prioritize relationships to primary keys or columns with similar naming
-                        is_likely_relationship = (
-                            col2['pk'] or  # col2 is a primary key
-                            col1['name'].endswith('_id') or col1['name'].endswith('_sku') or  # col1 looks like a foreign key
-                            col1['name'] == col2['name'] or  # same column name (like 'sku' referencing 'sku')
-                            col1['name'].replace('_id', '') in table2 or  # naming convention match
-                            col1['name'].replace('_sku', '') in table2
-                        )
-                        
-                        if not is_likely_relationship:
-                            continue
-                        
-                        # Get distinct values from both columns
-                        values1 = self.get_distinct_values(table1, col1['name'])
-                        values2 = self.get_distinct_values(table2, col2['name'])
-                        
-                        if not values1 or not values2 or len(values1) < 2:
-                            continue
-                        
-                        # Calculate overlap
-                        overlap = values1.intersection(values2)
-                        
-                        # For implicit relationships, we want high overlap of col1 values in col2
-                        # (meaning col1 is likely referencing col2)
-                        overlap_ratio = len(overlap) / len(values1)
-                        
-                        # Require high overlap (default 80%)
-                        if overlap_ratio >= threshold and len(overlap) >= 2:
-                            relationship = {
-                                "from_table": table1,
-                                "from_column": col1['name'],
-                                "to_table": table2,
-                                "to_column": col2['name'],
-                                "overlap_percentage": round(overlap_ratio * 100, 2),
-                                "match_count": len(overlap),
-                                "type": "implicit",
-                                "likely_direction": f"{table1}.{col1['name']} -> {table2}.{col2['name']}"
-                            }
-                            
-                            implicit_relationships.append(relationship)
-                            print(f"  Found: {table1}.{col1['name']} -> {table2}.{col2['name']} ({overlap_ratio*100:.1f}% overlap, {len(overlap)} matches)")
+                        # (same column name, like 'sku' referencing 'sku')
+                        if references_table2 or col2['pk'] or name1 == col2['name']:
+                            candidate_pairs.append((table1, name1, table2, col2['name']))
+        
+        return candidate_pairs
+    
+    def find_implicit_relationships(self, tables_info, explicit_fks, threshold=0.8):
+        """Find implicit relationships by analyzing value overlap between columns"""
+        implicit_relationships = []
+        
+        print("\nAnalyzing implicit relationships...")
+        
+        # One sketch per column, shared by every pair the column appears in
+        signatures = {}
+        
+        # Surviving target columns grouped by source column, in candidate order
+        targets_by_source = {}
+        
+        for table1, column1, table2, column2 in self.get_candidate_pairs(tables_info, explicit_fks):
+            for column in ((table1, column1), (table2, column2)):
+                if column not in signatures:
+                    signatures[column] = self.get_column_signature(*column)
+            signature1 = signatures[(table1, column1)]
+            signature2 = signatures[(table2, column2)]
+            
+            if signature1 is not None and signature2 is not None:
+                # A sketch shorter than SIGNATURE_SIZE holds every distinct value, so the target's count is exact;
+                # with fewer values than threshold x the source's, the overlap can never reach the threshold
+                if len(signature2) < SIGNATURE_SIZE and len(signature2) < threshold * len(signature1):
+                    continue
+                
+                # Skip the exact probe when the sketches show the overlap is far below threshold
+                estimate = estimate_containment(signature1, signature2)
+                if estimate is not None and estimate < threshold / 2:
+                    continue
+            
+            targets_by_source.setdefault((table1, column1), []).append((table2, column2))
+        
+        for (table1, column1), targets in targets_by_source.items():
+            distinct_count, match_counts = self.get_overlaps(table1, column1, targets)
+            
+            if distinct_count < 2:
+                continue
+            
+            for (table2, column2), match_count in zip(targets, match_counts):
+                # For implicit relationships, we want high overlap of col1 values in col2
+                # (meaning col1 is likely referencing col2)
+                overlap_ratio = match_count / distinct_count
+                
+                # Require high overlap (default 80%)
+                if overlap_ratio >= threshold and match_count >= 2:
+                    relationship = {
+                        "from_table": table1,
+                        "from_column": column1,
+                        "to_table": table2,
+                        "to_column": column2,
+                        "overlap_percentage": round(overlap_ratio * 100, 2),
+                        "match_count": match_count,
+                        "type": "implicit",
+                        "likely_direction": f"{table1}.{column1} -> {table2}.{column2}"
+                    }
+                    
+                    implicit_relationships.append(relationship)
+                    print(f"  Found: {table1}.{column1} -> {table2}.{column2} ({overlap_ratio*100:.1f}% overlap, {match_count} matches)")
         
         return implicit_relationships
     
+    def extract_table(self, table_name, columns_data):
+        """Extract columns and sample rows for a table and export it to CSV"""
+        print(f"Processing table: {table_name}")
+        
+        columns = []
+        for col in columns_data:
+            column_info = {
+                "name": col[0],
+                "type": col[1],
+                "nullable": col[3] == 'YES',
+                "pk": col[5]
+            }
+            
+            # Add max length if applicable
+            if col[2]:
+                column_info["max_length"] = col[2]
+            
+            # Add default value if applicable
+            if col[4]:
+                column_info["default"] = col[4]
+            
+            columns.append(column_info)
+        
+        # Get sample rows
+        sample_rows = self.get_sample_rows(table_name, limit=2)
+        
+        # Export table to CSV
+        csv_file = self.export_table_to_csv(table_name)
+        
+        return {
+            "columns": columns,
+            "sample_rows": sample_rows,
+            "csv_file": csv_file
+        }
+    
+    def run_pooled(self, method, *args):
+        """Run an extractor method on a pooled connection owned by the calling worker thread"""
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            self.cursor = cursor
+            try:
+                return method(*args)
+            finally:
+                self.cursor = None
+    
     def extract_schema(self):
         """Extract complete database schema"""
         schema = {
@@ -333,77 +477,54 @@ class SchemaExtractor:
             "implicit_relationships": []
         }
         
-        # Get all tables
+        # Get all tables, and the columns of all of them in a single round-trip
         tables = self.get_tables()
         print(f"Found {len(tables)} tables")
+        all_columns = self.get_all_columns()
         
-        # Process each table
-        for table_name in tables:
-            print(f"Processing table: {table_name}")
-            
-            # Get columns
-            columns_data = self.get_columns(table_name)
-            primary_keys = self.get_primary_keys(table_name)
+        with ThreadPoolExecutor(max_workers=TABLE_WORKERS) as executor:
+            # Process tables concurrently; map() keeps the results in table order
+            table_infos = executor.map(
+                lambda table_name: self.run_pooled(self.extract_table, table_name, all_columns.get(table_name, [])),
+                tables
+            )
+            for table_name, table_info in zip(tables, table_infos):
+                schema["tables"][table_name] = table_info
             
-            columns = []
-            for col in columns_data:
-                column_info = {
-                    "name": col[0],
-                    "type": col[1],
-                    "nullable": col[3] == 'YES',
-                    "pk": col[0] in primary_keys
-                }
-                
-                # Add max length if applicable
-                if col[2]:
-                    column_info["max_length"] = col[2]
-                
-                # Add default value if applicable
-                if col[4]:
-                    column_info["default"] = col[4]
-                
-                columns.append(column_info)
+            # Get foreign keys and start exporting them to CSV in the background
+            fk_data = self.get_foreign_keys()
+            fk_files = executor.map(
+                lambda fk: self.run_pooled(self.export_relationship_to_csv, fk[0], fk[1], fk[2], fk[3], "fk"),
+                fk_data
+            )
             
-            # Get sample rows
-            sample_rows = self.get_sample_rows(table_name, limit=2)
+            # Find implicit relationships on the main connection while the FK exports run
+            implicit_rels = self.find_implicit_relationships(schema["tables"], fk_data)
             
-            # Export table to CSV
-            csv_file = self.export_table_to_csv(table_name)
+            for fk, csv_file in zip(fk_data, fk_files):
+                schema["foreign_keys"].append({
+                    "from_table": fk[0],
+                    "from_column": fk[1],
+                    "to_table": fk[2],
+                    "to_column": fk[3],
+                    "constraint_name": fk[4],
+                    "csv_file": csv_file
+                })
             
-            schema["tables"][table_name] = {
-                "columns": columns,
-                "sample_rows": sample_rows,
-                "csv_file": csv_file
-            }
-        
-        # Get foreign keys
-        fk_data = self.get_foreign_keys()
-        for fk in fk_data:
-            # Export foreign key relationship to CSV
-            csv_file = self.export_relationship_to_csv(fk[0], fk[1], fk[2], fk[3], "fk")
-            
-            schema["foreign_keys"].append({
-                "from_table": fk[0],
-                "from_column": fk[1],
-                "to_table": fk[2],
-                "to_column": fk[3],
-                "constraint_name": fk[4],
-                "csv_file": csv_file
-            })
-        
-        # Find implicit relationships
-        implicit_rels = self.find_implicit_relationships(schema["tables"], fk_data)
-        
-        # Export implicit relationships to CSV and add to schema
-        for rel in implicit_rels:
-            csv_file = self.export_relationship_to_csv(
-                rel["from_table"], 
-                rel["from_column"], 
-                rel["to_table"], 
-                rel["to_column"], 
-                "implicit"
+            # Export implicit relationships to CSV and add to schema
+            implicit_files = executor.map(
+                lambda rel: self.run_pooled(
+                    self.export_relationship_to_csv,
+                    rel["from_table"],
+                    rel["from_column"],
+                    rel["to_table"],
+                    rel["to_column"],
+                    "implicit"
+                ),
+                implicit_rels
             )
-            rel["csv_file"] = csv_file
+            for rel, csv_file in zip(implicit_rels, implicit_files):
+                rel["csv_file"] = csv_file
         
         schema["implicit_relationships"] = implicit_rels
         
@@ -415,16 +536,12 @@ class SchemaExtractor:
             self.cursor.close()
         if self.conn:
             self.conn.close()
+        if self.pool:
+            self.pool.close()
         print("Database connection closed")
 
-def main():
-    # Get connection string from environment variable
-    connection_string = os.getenv("DATABASE_URL")
-    
-    if not connection_string:
-        print("Error: DATABASE_URL not found in environment variables")
-        return
-    
+def run(connection_string, output_file="schema_output.json"):
+    """Extract the database schema and CSV exports, raising if extraction fails"""
     # Create extractor instance
     extractor = SchemaExtractor(connection_string)
     
@@ -437,9 +554,8 @@ def main():
         schema = extractor.extract_schema()
         
         # Save to JSON file
-        output_file = "schema_output.json"
-        with open(output_file, 'w') as f:
-            json.dump(schema, f, indent=2)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(schema, option=orjson.OPT_INDENT_2))
         
         print(f"\nSchema extracted successfully!")
         print(f"Output saved to: {output_file}")
@@ -447,17 +563,33 @@ def main():
         print(f"Total foreign keys: {len(schema['foreign_keys'])}")
         print(f"Total implicit relationships: {len(schema['implicit_relationships'])}")
         
-        # Print preview
+        return schema
+    finally:
+        extractor.close()
+
+def main():
+    # Get connection string from environment variable
+    connection_string = os.getenv("DATABASE_URL")
+    
+    if not connection_string:
+        print("Error: DATABASE_URL not found in environment variables")
+        return
+    
+    try:
+        schema = run(connection_string)
+        
+        # Print a preview of the first few entries in each section; the full schema is in the output file
+        preview = {
+            section: dict(list(entries.items())[:PREVIEW_ENTRIES]) if isinstance(entries, dict) else entries[:PREVIEW_ENTRIES]
+            for section, entries in schema.items()
+        }
         print("\n" + "="*50)
-        print("SCHEMA PREVIEW:")
+        print(f"SCHEMA PREVIEW (first {PREVIEW_ENTRIES} of each):")
         print("="*50)
-        print(json.dumps(schema, indent=2))
+        print(json.dumps(preview, indent=2, default=str))
         
     except Exception as e:
         print(f"Error: {e}")
-    finally:
-        extractor.close()
 
 if __name__ == "__main__":
     main()
-
@@ -1,4 +1,5 @@
 import json
+import orjson
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
@@ -9,8 +10,8 @@ load_dotenv()
 def load_schema(schema_file="schema_output.json"):
     """Load the database schema from JSON file"""
     try:
-        with open(schema_file, 'r') as f:
-            return json.load(f)
+        with open(schema_file, 'rb') as f:
+            return orjson.loads(f.read())
     except Exception as e:
         print(f"Error loading schema file: {e}")
         return None
@@ -18,36 +19,38 @@ def load_schema(schema_file="schema_output.json"):
 def create_ontology_prompt(schema):
     """Create a detailed prompt for Gemini to generate ontology"""
     
-    prompt = f"""You are an expert in database schema analysis and ontology creation for Neo4j graph databases.
+    parts = [f"""You are an expert in database schema analysis and ontology creation for Neo4j graph databases.
 
 I have a database schema with the following structure:
 
 **Tables ({len(schema['tables'])} total):**
-"""
+"""]
     
     # Add table information
     for table_name, table_info in schema['tables'].items():
-        prompt += f"\n- **{table_name}** (CSV: {table_info['csv_file']})\n"
-        prompt += f"  Columns: "
-        cols = [f"{col['name']} ({col['type']}{'*' if col['pk'] else ''})" for col in table_info['columns']]
-        prompt += ", ".join(cols[:5])  # Show first 5 columns
-        if len(cols) > 5:
-            prompt += f", ... and {len(cols) - 5} more"
-        prompt += "\n"
+        parts.append(f"\n- **{table_name}** (CSV: {table_info['csv_file']})\n")
+        parts.append("  Columns: ")
+        columns = table_info['columns']
+        parts.append(", ".join(
+            f"{col['name']} ({col['type']}{'*' if col['pk'] else ''})" for col in columns[:5]
+        ))  # Show first 5 columns
+        if len(columns) > 5:
+            parts.append(f", ... and {len(columns) - 5} more")
+        parts.append("\n")
     
     # Add foreign key information
-    prompt += f"\n**Foreign Key Relationships ({len(schema['foreign_keys'])} total):**\n"
+    parts.append(f"\n**Foreign Key Relationships ({len(schema['foreign_keys'])} total):**\n")
     for fk in schema['foreign_keys']:
-        prompt += f"- {fk['from_table']}.{fk['from_column']} → {fk['to_table']}.{fk['to_column']} (CSV: {fk['csv_file']})\n"
+        parts.append(f"- {fk['from_table']}.{fk['from_column']} → {fk['to_table']}.{fk['to_column']} (CSV: {fk['csv_file']})\n")
     
     # Add implicit relationships
     if schema['implicit_relationships']:
-        prompt += f"\n**Implicit Relationships ({len(schema['implicit_relationships'])} total):**\n"
+        parts.append(f"\n**Implicit Relationships ({len(schema['implicit_relationships'])} total):**\n")
         for rel in schema['implicit_relationships']:
-            prompt += f"- {rel['from_table']}.{rel['from_column']} → {rel['to_table']}.{rel['to_column']} ({rel['overlap_percentage']}% match, CSV: {rel['csv_file']})\n"
+            parts.append(f"- {rel['from_table']}.{rel['from_column']} → {rel['to_table']}.{rel['to_column']} ({rel['overlap_percentage']}% match, CSV: {rel['csv_file']})\n")
     
     # Add the task description
-    prompt += """
+    parts.append("""
 
 **Task:** Create a Neo4j-compatible ontology from this database schema.
 
@@ -95,9 +98,9 @@ I have a database schema with the following structure:
 - For each node, map the most important columns to properties (at minimum: primary key, names, identifiers, important attributes)
 - Ensure the ontology is complete and ready for Neo4j import
 
-Generate the ontology JSON now:"""
+Generate the ontology JSON now:""")
 
-    return prompt
+    return "".join(parts)
 
 def generate_ontology_with_gemini(schema):
     """Use Gemini to generate ontology from schema"""
@@ -126,22 +129,12 @@ def generate_ontology_with_gemini(schema):
         print("Received response from Gemini!")
         print("=" * 60)
         
-        # Extract JSON from response
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks if present
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]  # Remove ```json
-        elif response_text.startswith("```"):
-            response_text = response_text[3:]  # Remove ```
-        
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]  # Remove trailing ```
-        
-        response_text = response_text.strip()
-        
-        # Parse JSON
-        ontology = json.loads(response_text)
+        # Parse the JSON object in place, skipping any markdown fence before it and ignoring what follows
+        response_text = response.text
+        start = response_text.find('{')
+        if start < 0:
+            raise ValueError("No JSON object in response")
+        ontology, _ = json.JSONDecoder().raw_decode(response_text, start)
         
         return ontology
         
@@ -153,45 +146,54 @@ def generate_ontology_with_gemini(schema):
 def save_ontology(ontology, output_file="ontology_output.json"):
     """Save the generated ontology to a JSON file"""
     try:
-        with open(output_file, 'w') as f:
-            json.dump(ontology, f, indent=2)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(ontology, option=orjson.OPT_INDENT_2))
         print(f"\nOntology saved to: {output_file}")
         return True
     except Exception as e:
         print(f"Error saving ontology: {e}")
         return False
 
-def main():
-    print("Schema to Ontology Converter")
-    print("=" * 60)
-    
+def run(schema_file="schema_output.json", output_file="ontology_output.json"):
+    """Generate the ontology from the extracted schema, raising if any step fails"""
     # Load schema
-    schema = load_schema()
+    schema = load_schema(schema_file)
     if not schema:
-        return
+        raise RuntimeError(f"Could not load schema from {schema_file}")
     
     print(f"Loaded schema with {len(schema['tables'])} tables")
     
     # Generate ontology using Gemini
     ontology = generate_ontology_with_gemini(schema)
+    if not ontology:
+        raise RuntimeError("Failed to generate ontology")
     
-    if ontology:
-        # Display the ontology
-        print("\nGenerated Ontology:")
-        print("=" * 60)
-        print(json.dumps(ontology, indent=2))
-        
-        # Save to file
-        save_ontology(ontology)
-        
-        # Summary
-        print("\n" + "=" * 60)
-        print("SUMMARY:")
-        print(f"  - Nodes: {len(ontology.get('nodes', []))}")
-        print(f"  - Edges: {len(ontology.get('edges', []))}")
-    else:
-        print("Failed to generate ontology")
+    # Save to file
+    if not save_ontology(ontology, output_file):
+        raise RuntimeError(f"Could not save ontology to {output_file}")
+    
+    return ontology
+
+def main():
+    print("Schema to Ontology Converter")
+    print("=" * 60)
+    
+    try:
+        ontology = run()
+    except Exception as e:
+        print(e)
+        return
+    
+    # Display the ontology
+    print("\nGenerated Ontology:")
+    print("=" * 60)
+    print(json.dumps(ontology, indent=2))
+    
+    # Summary
+    print("\n" + "=" * 60)
+    print("SUMMARY:")
+    print(f"  - Nodes: {len(ontology.get('nodes', []))}")
+    print(f"  - Edges: {len(ontology.get('edges', []))}")
 
 if __name__ == "__main__":
     main()
-
@@ -2,103 +2,64 @@
 Test script for the RAG API system
 """
 
-import requests
+import asyncio
+import httpx
 import json
 import time
 
 BASE_URL = "http://localhost:8000"
 
-def test_health():
+# Agent queries can take a while; don't let httpx's 5 second default cut them off
+REQUEST_TIMEOUT = httpx.Timeout(120.0)
+
+# Each test returns (title, output) so results can print in order after running concurrently
+async def test_health(client):
     """Test health endpoint"""
-    print("="*70)
-    print("TEST 1: Health Check")
-    print("="*70)
-    
-    response = requests.get(f"{BASE_URL}/health")
-    print(json.dumps(response.json(), indent=2))
-    print()
+    response = await client.get("/health")
+    return "TEST 1: Health Check", json.dumps(response.json(), indent=2)
 
-def test_stats():
+async def test_stats(client):
     """Test stats endpoint"""
-    print("="*70)
-    print("TEST 2: Graph Statistics")
-    print("="*70)
-    
-    response = requests.get(f"{BASE_URL}/stats")
-    print(response.json()['stats'])
-    print()
+    response = await client.get("/stats")
+    return "TEST 2: Graph Statistics", response.json()['stats']
 
-def test_chat_simple():
-    """Test chat endpoint with simple query"""
-    print("="*70)
-    print("TEST 3: Simple AI Chat Query")
-    print("="*70)
-    
-    query = "How many customers do we have?"
-    
-    print(f"Query: {query}\n")
-    
-    response = requests.post(
-        f"{BASE_URL}/chat",
+async def chat(client, query):
+    """Send a non-streaming chat query and format the response"""
+    response = await client.post(
+        "/chat",
         json={"query": query, "stream": False}
     )
     
     result = response.json()
-    print(f"Response: {result['response']}\n")
+    return f"Query: {query}\n\nResponse: {result['response']}\n"
+
+async def test_chat_simple(client):
+    """Test chat endpoint with simple query"""
+    return "TEST 3: Simple AI Chat Query", await chat(client, "How many customers do we have?")
 
-def test_chat_semantic():
+async def test_chat_semantic(client):
     """Test chat with semantic search"""
-    print("="*70)
-    print("TEST 4: Semantic Search Query")
-    print("="*70)
-    
-    query = "Find products related to wireless audio"
-    
-    print(f"Query: {query}\n")
-    
-    response = requests.post(
-        f"{BASE_URL}/chat",
-        json={"query": query, "stream": False}
-    )
-    
-    result = response.json()
-    print(f"Response: {result['response']}\n")
+    return "TEST 4: Semantic Search Query", await chat(client, "Find products related to wireless audio")
 
-def test_chat_complex():
+async def test_chat_complex(client):
     """Test chat with complex graph traversal"""
-    print("="*70)
-    print("TEST 5: Complex Graph Query")
-    print("="*70)
-    
-    query = "Show me customers who have placed orders with more than 2 items"
-    
-    print(f"Query: {query}\n")
-    
-    response = requests.post(
-        f"{BASE_URL}/chat",
-        json={"query": query, "stream": False}
-    )
-    
-    result = response.json()
-    print(f"Response: {result['response']}\n")
+    return "TEST 5: Complex Graph Query", await chat(client, "Show me customers who have placed orders with more than 2 items")
 
-def test_chat_relationship():
+async def test_chat_relationship(client):
     """Test chat with relationship query"""
-    print("="*70)
-    print("TEST 6: Relationship Query")
-    print("="*70)
-    
-    query = "What products has customer Aisha Khan ordered?"
-    
-    print(f"Query: {query}\n")
-    
-    response = requests.post(
-        f"{BASE_URL}/chat",
-        json={"query": query, "stream": False}
-    )
-    
-    result = response.json()
-    print(f"Response: {result['response']}\n")
+    return "TEST 6: Relationship Query", await chat(client, "What products has customer Aisha Khan ordered?")
+
+async def run_tests():
+    """Run all tests concurrently over one keep-alive client"""
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=REQUEST_TIMEOUT) as client:
+        return await asyncio.gather(
+            test_health(client),
+            test_stats(client),
+            test_chat_simple(client),
+            test_chat_semantic(client),
+            test_chat_complex(client),
+            test_chat_relationship(client)
+        )
 
 def main():
     print("\n")
@@ -108,20 +69,22 @@ def main():
     print()
     
     try:
-        test_health()
-        test_stats()
-        test_chat_simple()
-        test_chat_semantic()
-        test_chat_complex()
-        test_chat_relationship()
+        start = time.perf_counter()
+        results = asyncio.run(run_tests())
+        
+        for title, output in results:
+            print("="*70)
+            print(title)
+            print("="*70)
+            print(output)
+            print()
         
         print("="*70)
-        print("✓ ALL TESTS COMPLETED SUCCESSFULLY!")
+        print(f"✓ ALL TESTS COMPLETED SUCCESSFULLY! ({time.perf_counter() - start:.1f}s)")
         print("="*70)
-        
+    
     except Exception as e:
         print(f"\n✗ Error: {e}")
 
 if __name__ == "__main__":
     main()
-
@@ -4,43 +4,105 @@ Vector Embedding and FAISS Indexing for Knowledge Graph Nodes
 
 import os
 import json
-import pickle
+import queue
+import sys
+import threading
+import orjson
 import numpy as np
 import faiss
+import pyarrow as pa
+import pyarrow.parquet as pq
+import torch
 from sentence_transformers import SentenceTransformer
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple
 
 load_dotenv()
 
+# IVF-PQ settings: PQ_SUBQUANTIZERS codes of PQ_BITS bits per vector, IVF_NPROBE lists scanned per query
+PQ_SUBQUANTIZERS = 48
+PQ_BITS = 8
+IVF_NPROBE = 16
+
+# Node texts are encoded ENCODE_CHUNK_SIZE at a time while streaming from Neo4j,
+# in model batches of ENCODE_BATCH_SIZE (GPU_BATCH_SIZE on CUDA, where larger batches keep the device busy)
+ENCODE_CHUNK_SIZE = 4096
+ENCODE_BATCH_SIZE = 128
+GPU_BATCH_SIZE = 256
+
+# Encoder runtime on CPU: "torch", or "onnx" for ONNX Runtime (needs sentence-transformers[onnx])
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+# CPU index builds encode in this many worker processes (a single process can't use every core)
+ENCODE_PROCESSES = min(4, (os.cpu_count() or 1) // 2)
+
+# Indexes at least this large are memory-mapped on load; smaller ones are read into RAM
+MMAP_MIN_BYTES = 64 << 20
+
+# Query embeddings kept by search(), least recently used evicted first
+QUERY_CACHE_SIZE = 1024
+
+# Chunks read ahead from Neo4j while the encoder works on the current one
+PREFETCH_CHUNKS = 2
+
+# Node labels read from Neo4j at once, each in its own session and thread
+NODE_READERS = 4
+
+# Records pulled from Neo4j per Bolt round trip while streaming nodes
+NEO4J_FETCH_SIZE = 10_000
+
+# k-means needs ~39 training points per IVF list
+IVF_POINTS_PER_LIST = 39
+
+# PQ training wants ~39 points per centroid; below that a flat scan of 8-bit scalar-quantized
+# vectors is used (and is fast anyway)
+IVF_MIN_VECTORS = IVF_POINTS_PER_LIST * (1 << PQ_BITS)
+
+# Embedding text per node label: a format string and the values used for missing properties
+# (anything not listed falls back to an empty string)
+NODE_TEXT_TEMPLATES = {
+    "Product": ("Product: {name}. SKU: {sku}. Price: ${unitPrice}. Category: {category}", {"category": "N/A"}),
+    "Customer": ("Customer: {firstName} {lastName}. Email: {email}. Phone: {phone}", {"phone": "N/A"}),
+    "Order": ("Order #{nodeId}. Status: {status}. Total: ${totalAmount}. Date: {orderDate}", {}),
+    "Category": ("Category: {name}. Description: {description}", {}),
+    "OrderItem": ("Order item. Quantity: {quantity}. Unit price: ${unitPrice}. Total: ${lineTotal}", {}),
+}
+
 class VectorIndexer:
     def __init__(self, model_name="all-MiniLM-L6-v2"):
         """Initialize with sentence transformer model"""
-        self.model = SentenceTransformer(model_name)
+        # Run the encoder on the GPU in half precision when there is one, otherwise on the
+        # configured CPU backend
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.backend = EMBEDDING_BACKEND if self.device == "cpu" else "torch"
+        self.model = SentenceTransformer(model_name, device=self.device, backend=self.backend)
+        if self.device == "cuda":
+            self.model.half()
+        self.batch_size = GPU_BATCH_SIZE if self.device == "cuda" else ENCODE_BATCH_SIZE
         self.dimension = self.model.get_sentence_embedding_dimension()
         self.index = None
-        self.node_metadata = []  # Store node info for retrieval
+        self.ivf = None  # IVF layer of the index, if it has one
+        self.mmap_path = None  # File the loaded index is memory-mapped from, if it is
+        self.nprobe = IVF_NPROBE  # IVF lists scanned per query: higher is more accurate but slower
+        # Node info for retrieval, one parallel list per field (row i describes vector i); texts
+        # aren't kept, they're rebuilt from the properties for search hits
+        self.node_types = []
+        self.node_ids = []
+        self.node_properties = []
+        self.query_cache = OrderedDict()  # Normalized query -> embedding row
+        self.query_cache_lock = threading.Lock()  # Searches embed from several threads
         
     def create_node_text(self, node_type: str, props: Dict) -> str:
         """Create text representation for embedding"""
-        if node_type == "Product":
-            return f"Product: {props.get('name', '')}. SKU: {props.get('sku', '')}. Price: ${props.get('unitPrice', '')}. Category: {props.get('category', 'N/A')}"
-        
-        elif node_type == "Customer":
-            return f"Customer: {props.get('firstName', '')} {props.get('lastName', '')}. Email: {props.get('email', '')}. Phone: {props.get('phone', 'N/A')}"
-        
-        elif node_type == "Order":
-            return f"Order #{props.get('nodeId', '')}. Status: {props.get('status', '')}. Total: ${props.get('totalAmount', '')}. Date: {props.get('orderDate', '')}"
-        
-        elif node_type == "Category":
-            return f"Category: {props.get('name', '')}. Description: {props.get('description', '')}"
-        
-        elif node_type == "OrderItem":
-            return f"Order item. Quantity: {props.get('quantity', '')}. Unit price: ${props.get('unitPrice', '')}. Total: ${props.get('lineTotal', '')}"
-        
-        else:
+        template = NODE_TEXT_TEMPLATES.get(node_type)
+        if template is None:
             return " ".join([f"{k}: {v}" for k, v in props.items() if isinstance(v, (str, int, float))])
+        
+        text_format, defaults = template
+        return text_format.format_map(defaultdict(str, defaults, **props))
     
     def build_index_from_neo4j(self, neo4j_uri: str, neo4j_user: str, neo4j_password: str):
         """Build FAISS index from all nodes in Neo4j"""
@@ -48,109 +110,262 @@ class VectorIndexer:
         
         driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
         
-        all_texts = []
-        all_embeddings = []
+        # The build is a one-off bulk encode, so on CPU spread it over worker processes, or
+        # let torch use every core if there are too few for that (the API server pins torch
+        # to one thread per search worker); ONNX Runtime already runs on every core
+        pool = None
+        num_threads = torch.get_num_threads()
+        if self.device == "cpu" and self.backend == "torch":
+            if ENCODE_PROCESSES > 1:
+                pool = self.model.start_multi_process_pool(["cpu"] * ENCODE_PROCESSES)
+            else:
+                torch.set_num_threads(os.cpu_count())
         
         try:
-            with driver.session() as session:
-                # Get all node labels
-                labels_result = session.run("CALL db.labels()")
-                node_types = [record["label"] for record in labels_result]
-                
-                print(f"  Found node types: {', '.join(node_types)}")
+            # Size the embedding matrix up front from the node count store, so chunks are copied
+            # straight into place instead of being collected and concatenated at the end
+            records, _, _ = driver.execute_query("MATCH (n) RETURN count(n) AS c")
+            all_embeddings = np.empty((records[0]["c"], self.dimension), dtype=np.float32)
+            filled = 0
+            self.node_types, self.node_ids, self.node_properties = [], [], []
+            
+            records, _, _ = driver.execute_query("CALL db.labels() YIELD label RETURN label")
+            node_types = [record["label"] for record in records]
+            print(f"  Found node types: {', '.join(node_types)}")
+            
+            # Reader threads stream each label's nodes from Neo4j into chunks while this one
+            # encodes, so Bolt I/O overlaps across labels and with the model
+            chunks = queue.Queue(maxsize=PREFETCH_CHUNKS)
+            stop = threading.Event()
+            workers = max(1, min(NODE_READERS, len(node_types)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="neo4j-reader") as executor:
+                readers = [executor.submit(self.read_node_chunks, driver, node_type, chunks, stop)
+                           for node_type in node_types]
+                remaining = len(readers)  # Readers that haven't put their closing None yet
+                try:
+                    while remaining:
+                        chunk = chunks.get()
+                        if chunk is None:
+                            remaining -= 1
+                            continue
+                        
+                        types, ids, texts, properties = chunk
+                        end = filled + len(texts)
+                        if end > len(all_embeddings):
+                            # Nodes were created after the count; grow to fit
+                            all_embeddings = np.concatenate([all_embeddings[:filled], np.empty(
+                                (end - filled, self.dimension), dtype=np.float32)])
+                        all_embeddings[filled:end] = self.encode_texts(texts, pool)
+                        filled = end
+                        self.node_types.extend(types)
+                        self.node_ids.extend(ids)
+                        self.node_properties.extend(properties)
+                        print(f"  Encoded {filled} nodes...")
+                finally:
+                    # If encoding failed, stop the readers and unblock their pending puts
+                    stop.set()
+                    while remaining:
+                        if chunks.get() is None:
+                            remaining -= 1
+                for reader in readers:
+                    reader.result()
+            
+            print(f"  Total nodes: {filled}")
+            # Unlabelled nodes are counted but never read
+            all_embeddings = all_embeddings[:filled]
+            
+            # Build FAISS index
+            print("  Building FAISS index...")
+            self.index = self.create_index(all_embeddings)
+            self.mmap_path = None
+            self.ivf = self.find_ivf()
+            
+            print(f"  ✓ FAISS index built with {self.index.ntotal} vectors")
+            
+        finally:
+            driver.close()
+            torch.set_num_threads(num_threads)
+            if pool is not None:
+                self.model.stop_multi_process_pool(pool)
+    
+    def read_node_chunks(self, driver, node_type: str, chunks: queue.Queue, stop: threading.Event):
+        """Stream one label's nodes into chunks of (types, ids, texts, properties), then put None"""
+        try:
+            if stop.is_set():
+                return
+            
+            node_type = sys.intern(node_type)  # One shared string per label
+            with driver.session(fetch_size=NEO4J_FETCH_SIZE) as session:
+                # Nodes are read under their first label only, so multi-label nodes aren't indexed twice
+                label = node_type.replace("`", "``")
+                result = session.run(
+                    f"MATCH (n:`{label}`) WHERE labels(n)[0] = $label RETURN properties(n) AS p",
+                    label=node_type
+                )
                 
-                for node_type in node_types:
-                    print(f"  Processing {node_type} nodes...")
+                types, ids, texts, properties = [], [], [], []
+                for record in result:
+                    props = record["p"]
                     
-                    # Get all nodes of this type
-                    query = f"MATCH (n:{node_type}) RETURN n"
-                    result = session.run(query)
+                    # Create text representation
+                    text = self.create_node_text(node_type, props)
                     
-                    for record in result:
-                        node = record["n"]
-                        props = dict(node)
-                        
-                        # Create text representation
-                        text = self.create_node_text(node_type, props)
-                        
-                        # Store metadata
-                        self.node_metadata.append({
-                            "type": node_type,
-                            "id": props.get("nodeId", props.get("id", "")),
-                            "text": text,
-                            "properties": props
-                        })
-                        
-                        all_texts.append(text)
-                
-                print(f"  Total nodes: {len(all_texts)}")
-                
-                # Generate embeddings
-                print("  Generating embeddings...")
-                all_embeddings = self.model.encode(all_texts, show_progress_bar=True)
-                
-                # Build FAISS index
-                print("  Building FAISS index...")
-                self.index = faiss.IndexFlatIP(self.dimension)  # Inner product (cosine similarity)
-                
-                # Normalize vectors for cosine similarity
-                faiss.normalize_L2(all_embeddings)
-                self.index.add(all_embeddings)
-                
-                print(f"  ✓ FAISS index built with {self.index.ntotal} vectors")
+                    types.append(node_type)
+                    ids.append(props.get("nodeId", props.get("id", "")))
+                    texts.append(text)
+                    properties.append(props)
+                    
+                    if len(texts) >= ENCODE_CHUNK_SIZE:
+                        if stop.is_set():
+                            return
+                        chunks.put((types, ids, texts, properties))
+                        types, ids, texts, properties = [], [], [], []
                 
+                if texts:
+                    chunks.put((types, ids, texts, properties))
         finally:
-            driver.close()
+            chunks.put(None)
+    
+    def encode_texts(self, texts: List[str], pool=None) -> np.ndarray:
+        """Embed texts as L2-normalized float32 rows, across a multi-process pool if given"""
+        if pool is not None:
+            embeddings = self.model.encode_multi_process(
+                texts, pool, batch_size=self.batch_size, normalize_embeddings=True
+            )
+        else:
+            # encode() orders texts by length internally, so batches carry little padding, and
+            # normalizes on the device so cosine similarity is a plain inner product
+            embeddings = self.model.encode(
+                texts, batch_size=self.batch_size, convert_to_numpy=True, normalize_embeddings=True
+            )
+        # FAISS needs C-contiguous float32; this is a no-op for what encode() normally returns
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    def create_index(self, embeddings: np.ndarray):
+        """Create and fill an inner-product (cosine similarity) index sized to the embeddings"""
+        n = len(embeddings)
+        if n == 0:
+            return faiss.IndexFlatIP(self.dimension)
+        
+        if n < IVF_MIN_VECTORS or self.dimension % PQ_SUBQUANTIZERS != 0:
+            # One byte per dimension: a quarter of the float32 footprint, trained from per-dimension ranges
+            index = faiss.IndexScalarQuantizer(
+                self.dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(embeddings)
+            index.add(embeddings)
+            return index
+        
+        # OPQ rotation, then IVF-PQ: ~4*sqrt(N) coarse clusters, each vector stored as
+        # PQ_SUBQUANTIZERS one-byte codes
+        nlist = min(int(4 * np.sqrt(n)), n // IVF_POINTS_PER_LIST)
+        factory = f"OPQ{PQ_SUBQUANTIZERS},IVF{nlist},PQ{PQ_SUBQUANTIZERS}x{PQ_BITS}"
+        index = faiss.index_factory(self.dimension, factory, faiss.METRIC_INNER_PRODUCT)
+        
+        # Train and fill on the GPU when this FAISS build has one, then copy back for saving
+        if hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0:
+            resources = faiss.StandardGpuResources()
+            options = faiss.GpuClonerOptions()
+            options.useFloat16 = True  # Half-precision PQ lookup tables fit shared memory at PQ48
+            gpu_index = faiss.index_cpu_to_gpu(resources, 0, index, options)
+            gpu_index.train(embeddings)
+            gpu_index.add(embeddings)
+            index = faiss.index_gpu_to_cpu(gpu_index)
+        else:
+            index.train(embeddings)
+            index.add(embeddings)
+        print(f"  ✓ Trained {factory} index")
+        return index
     
-    def save_index(self, index_path="faiss_index.bin", metadata_path="index_metadata.pkl"):
+    def find_ivf(self):
+        """Return the IVF layer of the current index, or None for a flat or scalar-quantized index"""
+        try:
+            return faiss.extract_index_ivf(self.index)
+        except RuntimeError:
+            return None
+    
+    def save_index(self, index_path="faiss_index.bin", metadata_path="index_metadata.parquet"):
         """Save FAISS index and metadata to disk"""
         if self.index is None:
             raise ValueError("No index to save. Build index first.")
         
         faiss.write_index(self.index, index_path)
         
-        with open(metadata_path, 'wb') as f:
-            pickle.dump({
-                'metadata': self.node_metadata,
-                'dimension': self.dimension
-            }, f)
+        # One column per field; ids are left out since they're read back from the properties,
+        # which are stored as JSON (str() covers Neo4j temporal values)
+        table = pa.table({
+            'type': self.node_types,
+            'properties': [orjson.dumps(props, default=str) for props in self.node_properties]
+        }).replace_schema_metadata({'dimension': str(self.dimension)})
+        pq.write_table(table, metadata_path)
         
         print(f"  ✓ Index saved to {index_path}")
         print(f"  ✓ Metadata saved to {metadata_path}")
     
-    def load_index(self, index_path="faiss_index.bin", metadata_path="index_metadata.pkl"):
+    def load_index(self, index_path="faiss_index.bin", metadata_path="index_metadata.parquet", mmap=True):
         """Load FAISS index and metadata from disk"""
-        self.index = faiss.read_index(index_path)
+        # Memory-map large indexes so the OS page cache, not process RAM, holds the vectors
+        mmap = mmap and os.path.getsize(index_path) >= MMAP_MIN_BYTES
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        self.index = faiss.read_index(index_path, io_flags)
+        self.mmap_path = index_path if mmap else None
+        self.ivf = self.find_ivf()
         
-        with open(metadata_path, 'rb') as f:
-            data = pickle.load(f)
-            self.node_metadata = data['metadata']
-            self.dimension = data['dimension']
+        table = pq.read_table(metadata_path, memory_map=True)
+        self.dimension = int(table.schema.metadata[b'dimension'])
+        self.node_types = [sys.intern(node_type) for node_type in table.column('type').to_pylist()]
+        self.node_properties = [orjson.loads(props) for props in table.column('properties').to_pylist()]
+        self.node_ids = [props.get("nodeId", props.get("id", "")) for props in self.node_properties]
         
         print(f"  ✓ Index loaded with {self.index.ntotal} vectors")
     
-    def search(self, query: str, k: int = 5) -> List[Dict]:
-        """Search for similar nodes using vector similarity"""
+    def embed_batch(self, queries: List[str]) -> np.ndarray:
+        """Embed queries as L2-normalized float32 rows, encoding only those not recently seen"""
+        keys = [query.strip().lower() for query in queries]
+        with self.query_cache_lock:
+            rows = {key: self.query_cache[key] for key in keys if key in self.query_cache}
+            for key in rows:
+                self.query_cache.move_to_end(key)
+        
+        # Misses are encoded together, outside the lock
+        missing = [key for key in dict.fromkeys(keys) if key not in rows]
+        if missing:
+            embeddings = self.encode_texts(missing)
+            rows.update(zip(missing, embeddings))
+            with self.query_cache_lock:
+                for key, row in zip(missing, embeddings):
+                    self.query_cache[key] = row
+                while len(self.query_cache) > QUERY_CACHE_SIZE:
+                    self.query_cache.popitem(last=False)
+        
+        return np.stack([rows[key] for key in keys])
+    
+    def search_embeddings(self, embeddings: np.ndarray, k: int = 5) -> List[List[Dict]]:
+        """Search the index with a batch of query embeddings, one result list per row"""
         if self.index is None:
             raise ValueError("No index loaded. Build or load index first.")
         
-        # Generate query embedding
-        query_embedding = self.model.encode([query])
-        faiss.normalize_L2(query_embedding)
+        if self.ivf is not None:
+            self.ivf.nprobe = self.nprobe
+        distances, indices = self.index.search(embeddings, k)
         
-        # Search
-        distances, indices = self.index.search(query_embedding, k)
-        
-        # Return results
-        results = []
-        for i, (idx, dist) in enumerate(zip(indices[0], distances[0])):
-            if idx < len(self.node_metadata):
-                result = self.node_metadata[idx].copy()
-                result['similarity_score'] = float(dist)
-                result['rank'] = i + 1
-                results.append(result)
+        # FAISS pads rows with -1 when fewer than k hits exist; drop those in one vectorized mask
+        valid = (indices >= 0) & (indices < len(self.node_types))
+        types, ids, properties = self.node_types, self.node_ids, self.node_properties
+        return [
+            [{'type': types[idx], 'id': ids[idx], 'text': self.create_node_text(types[idx], properties[idx]),
+              'properties': properties[idx], 'similarity_score': dist, 'rank': rank}
+             for rank, (idx, dist) in enumerate(zip(row_indices[row_valid].tolist(),
+                                                    row_distances[row_valid].tolist()), 1)]
+            for row_indices, row_distances, row_valid in zip(indices, distances, valid)
+        ]
+    
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        """Search for similar nodes using vector similarity"""
+        if self.index is None:
+            raise ValueError("No index loaded. Build or load index first.")
         
-        return results
+        return self.search_embeddings(self.embed_batch([query]), k)[0]
 
 def main():
     """Test the vector indexer"""